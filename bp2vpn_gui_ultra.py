@@ -8,11 +8,20 @@ import sys
 import os
 import logging
 from pathlib import Path
-from datetime import datetime, timedelta
-from typing import Dict, List, Set, Optional, Tuple
-import time
-from collections import defaultdict
+from datetime import datetime, timedelta, date
+from typing import Dict, List, Optional, Tuple, Iterator, TextIO, Callable, AnyStr
+import struct
+import marshal
+from types import MappingProxyType
+from functools import lru_cache, partial
+from itertools import compress
 import zipfile
+import io
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+from xml.sax.saxutils import escape as xml_escape
 
 # 設置 logging
 logger = logging.getLogger(__name__)
@@ -26,24 +35,18 @@ logging.basicConfig(
 
 try:
     from PySide6.QtWidgets import (QApplication, QMessageBox, QMainWindow, QVBoxLayout, 
-                                   QWidget, QPushButton, QLabel, QFileDialog, QTableWidget, 
-                                   QTableWidgetItem, QHeaderView, QCheckBox, QHBoxLayout, 
+                                   QWidget, QPushButton, QLabel, QFileDialog, QTableView, 
+                                   QHeaderView, QHBoxLayout, QStyledItemDelegate,
                                    QLineEdit, QStatusBar, QProgressBar, QSpinBox, QComboBox,
                                    QDateEdit, QButtonGroup, QRadioButton)
-    from PySide6.QtCore import Qt, QTimer, Signal, QThread, QObject, QDate
+    from PySide6.QtCore import (Qt, QTimer, Signal, QThread, QObject, QDate,
+                                QAbstractTableModel, QModelIndex)
     from PySide6.QtGui import QFont, QColor, QBrush, QCloseEvent
 except ImportError as e:
     print(f"錯誤: 無法匯入PySide6: {e}")
     print("請執行: pip install PySide6")
     sys.exit(1)
 
-try:
-    import dbf
-except ImportError as e:
-    print(f"錯誤: 無法匯入dbf模組: {e}")
-    print("請執行: pip install dbf")
-    sys.exit(1)
-
 
 # ============================================================================
 # 常數定義
@@ -108,16 +111,66 @@ class BloodPressureRange:
     DIASTOLIC_MAX = 150
 
 
+# 熱點迴圈使用的血壓範圍 - 模組層級常數，省去每次的類別屬性查詢
+_SYSTOLIC_MIN = BloodPressureRange.SYSTOLIC_MIN
+_SYSTOLIC_MAX = BloodPressureRange.SYSTOLIC_MAX
+_DIASTOLIC_MIN = BloodPressureRange.DIASTOLIC_MIN
+_DIASTOLIC_MAX = BloodPressureRange.DIASTOLIC_MAX
+
+# 固定XML標籤行 - 模組載入時組合一次，匯出時直接寫入
+XML_H1_LINE = f'    <h1>{HealthInsuranceCode.REPORT_TYPE}</h1>'
+XML_H3_LINE = f'    <h3>{HealthInsuranceCode.MEDICAL_CATEGORY}</h3>'
+XML_H6_LINE = f'    <h6>{HealthInsuranceCode.CASE_TYPE}</h6>'
+XML_H8_LINE = f'    <h8>{HealthInsuranceCode.CARD_REPLACEMENT}</h8>'
+XML_H15_LINE = f'    <h15>{HealthInsuranceCode.DIAGNOSIS_CODE}</h15>'
+XML_H22_H26_LINES = (f'    <h22>{HealthInsuranceCode.BP_TEST_NAME}</h22>\n'
+                     f'    <h26>{HealthInsuranceCode.TRANSFER_FLAG}</h26>')
+XML_SYSTOLIC_HEAD_LINES = ('    <rdata>\n'
+                           f'      <r1>{HealthInsuranceCode.SYSTOLIC_SEQ}</r1>\n'
+                           f'      <r2>{HealthInsuranceCode.SYSTOLIC_NAME}</r2>\n'
+                           f'      <r3>{HealthInsuranceCode.BP_TEST_METHOD}</r3>')
+XML_SYSTOLIC_UNIT_LINES = (f'      <r5>{HealthInsuranceCode.BP_UNIT}</r5>\n'
+                           f'      <r6-1>{HealthInsuranceCode.SYSTOLIC_REFERENCE}</r6-1>')
+XML_DIASTOLIC_HEAD_LINES = ('    <rdata>\n'
+                            f'      <r1>{HealthInsuranceCode.DIASTOLIC_SEQ}</r1>\n'
+                            f'      <r2>{HealthInsuranceCode.DIASTOLIC_NAME}</r2>\n'
+                            f'      <r3>{HealthInsuranceCode.BP_TEST_METHOD}</r3>')
+XML_DIASTOLIC_UNIT_LINES = (f'      <r5>{HealthInsuranceCode.BP_UNIT}</r5>\n'
+                            f'      <r6-1>{HealthInsuranceCode.DIASTOLIC_REFERENCE}</r6-1>')
+
+# 每位病患的<hdata>區塊樣板；選填標籤以含前置換行的整段字串代入，無資料時為空字串
+XML_HDATA_TEMPLATE = '\n'.join([
+    '  <hdata>',
+    XML_H1_LINE,
+    '    <h2>{hospital_code}</h2>',
+    XML_H3_LINE,
+    '    <h4>{h4}</h4>',
+    '    <h5>{h5}</h5>',
+    XML_H6_LINE,
+    '    <h7>{h7}</h7>',
+    XML_H8_LINE + '{h9_to_h12}',
+    XML_H15_LINE,
+    '    <h16>{h16}</h16>{h20}',
+    XML_H22_H26_LINES + '{rdata}',
+    '  </hdata>',
+])
+
+
+# DBF字元欄位編碼（展望系統使用Big5/CP950）
+DBF_ENCODING = "cp950"
+DBF_PAD_BYTES = b' \t\r\n\x00'  # DBF欄位填充字元 (cp950雙位元組字不會含有這些位元組)
+
+
 # ============================================================================
 # 輔助函式
 # ============================================================================
 
-def normalize_patient_id(patient_id: str) -> str:
+def normalize_patient_id(patient_id: AnyStr) -> AnyStr:
     """
     統一格式化病歷號為7位數
 
     Args:
-        patient_id: 原始病歷號
+        patient_id: 原始病歷號（字串，或讀取DBF時尚未解碼的位元組）
 
     Returns:
         格式化後的病歷號（7位數，左側補零）
@@ -125,6 +178,22 @@ def normalize_patient_id(patient_id: str) -> str:
     return patient_id.strip().zfill(7)
 
 
+def is_valid_blood_pressure(systolic: int, diastolic: int) -> bool:
+    """
+    檢查血壓數值是否在合理範圍內
+
+    Args:
+        systolic: 收縮壓
+        diastolic: 舒張壓
+
+    Returns:
+        收縮壓與舒張壓皆在合理範圍內時為True
+    """
+    return (_SYSTOLIC_MIN <= systolic <= _SYSTOLIC_MAX and
+            _DIASTOLIC_MIN <= diastolic <= _DIASTOLIC_MAX)
+
+
+@lru_cache(maxsize=4096)
 def calculate_r10_time(hdate: str, htime: str, unified_second: int) -> str:
     """
     計算r10時間標籤（測量時間加一分鐘，秒數統一）
@@ -158,16 +227,406 @@ def calculate_r10_time(hdate: str, htime: str, unified_second: int) -> str:
         return hdate + htime
 
 
+@lru_cache(maxsize=512)
+def build_bp_rdata_lines(is_systolic: bool, value: int) -> str:
+    """
+    組合rdata中r1~r6-1的標籤行（血壓數值範圍有限，快取命中率高）
+
+    Args:
+        is_systolic: True為收縮壓，False為舒張壓
+        value: 血壓數值
+
+    Returns:
+        以換行連接的<rdata>開頭至<r6-1>標籤行
+    """
+    if is_systolic:
+        head, unit = XML_SYSTOLIC_HEAD_LINES, XML_SYSTOLIC_UNIT_LINES
+    else:
+        head, unit = XML_DIASTOLIC_HEAD_LINES, XML_DIASTOLIC_UNIT_LINES
+    return f'{head}\n      <r4>{value}</r4>\n{unit}'
+
+
+@lru_cache(maxsize=4096)
+def format_tw_date(date_tw: str) -> str:
+    """
+    民國年日期轉為表格顯示的西元日期（同一天的記錄很多，快取命中率高）
+
+    Args:
+        date_tw: 民國年日期 (YYYMMDD)
+
+    Returns:
+        YYYY/MM/DD格式日期；長度不足時回傳空字串，無法解析時回傳原字串
+    """
+    if len(date_tw) < 7:
+        return ""
+    try:
+        return f"{int(date_tw[:3]) + 1911}/{date_tw[3:5]}/{date_tw[5:7]}"
+    except ValueError:
+        return date_tw
+
+
+@lru_cache(maxsize=8192)
+def is_big5_char(char: str) -> bool:
+    """單一字元是否可以Big5編碼"""
+    try:
+        char.encode('big5')
+        return True
+    except UnicodeEncodeError:
+        return False
+
+
+def find_non_big5_chars(values) -> set:
+    """
+    找出無法以Big5編碼的字元
+
+    Args:
+        values: 要匯出的字串值（重複值只檢查一次）
+
+    Returns:
+        無法編碼的字元集合，全部可編碼時為空集合
+    """
+    problematic_chars = set()
+    for value in set(values):
+        try:
+            value.encode('big5')
+        except UnicodeEncodeError:
+            problematic_chars.update(char for char in value if not is_big5_char(char))
+    return problematic_chars
+
+
+class DbfRawReader:
+    """DBF原始讀取器 - 直接切割固定長度記錄，只解碼需要的欄位"""
+
+    READ_BATCH = 4096  # 每次讀取的記錄筆數
+    PREFETCH_BLOCKS = 4  # 背景預讀的區塊數上限
+
+    def __init__(self, path: str, encoding: str = DBF_ENCODING):
+        self.path = path
+        self.encoding = encoding
+        self.fields: Dict[str, Tuple[int, int]] = {}  # 欄位名稱 -> (位移, 長度)
+
+        with open(path, 'rb') as f:
+            header = f.read(32)
+            if len(header) < 32:
+                raise ValueError(f"DBF檔頭不完整: {path}")
+
+            self.record_count, self.header_length, self.record_length = struct.unpack('<IHH', header[4:12])
+
+            # 欄位描述區，每個欄位32 bytes，以0x0D結尾；位移0為刪除旗標
+            descriptors = f.read(self.header_length - 32)
+            offset = 1
+            for start in range(0, len(descriptors) - 31, 32):
+                descriptor = descriptors[start:start + 32]
+                if descriptor[0] == 0x0D:
+                    break
+                name = descriptor[:11].split(b'\x00', 1)[0].decode('ascii').strip().upper()
+                length = descriptor[16]
+                self.fields[name] = (offset, length)
+                offset += length
+
+    def __len__(self) -> int:
+        return self.record_count
+
+    @staticmethod
+    def _advise(f, offset: int, length: int, advice_name: str) -> None:
+        """提示作業系統讀取方式（僅POSIX系統支援，其他平台略過）"""
+        advise = getattr(os, 'posix_fadvise', None)
+        if advise is None:
+            return
+        try:
+            advise(f.fileno(), offset, length, getattr(os, advice_name))
+        except (OSError, AttributeError):
+            pass
+
+    def _iter_blocks(self, f, reverse: bool, end: Optional[int] = None) -> Iterator[Tuple[bytes, range]]:
+        """依序(或由檔尾往前)讀取記錄區塊，回傳 (區塊, 各記錄起始位移)；end限制只讀前end筆記錄"""
+        record_length = self.record_length
+        block_bytes = self.READ_BATCH * record_length
+        record_count = self.record_count if end is None else min(end, self.record_count)
+        if not reverse:
+            self._advise(f, self.header_length, 0, 'POSIX_FADV_SEQUENTIAL')
+            f.seek(self.header_length)
+            remaining = record_count
+            while remaining > 0:
+                block = f.read(min(remaining, self.READ_BATCH) * record_length)
+                count = len(block) // record_length
+                if count == 0:
+                    return
+                remaining -= count
+                yield block, range(0, count * record_length, record_length)
+        else:
+            position = record_count
+            while position > 0:
+                count = min(position, self.READ_BATCH)
+                position -= count
+                start = self.header_length + position * record_length
+                # 反向讀取無法利用系統預讀，先預告下一個(較前面的)區塊
+                if position > 0:
+                    prefetch = min(position * record_length, block_bytes)
+                    self._advise(f, start - prefetch, prefetch, 'POSIX_FADV_WILLNEED')
+                f.seek(start)
+                block = f.read(count * record_length)
+                count = len(block) // record_length  # 檔案被截斷時只處理完整的記錄
+                yield block, range((count - 1) * record_length, -1, -record_length)
+
+    def _iter_prefetched_blocks(self, f, reverse: bool,
+                                end: Optional[int] = None) -> Iterator[Tuple[bytes, range]]:
+        """由背景執行緒預讀區塊，讓磁碟讀取與記錄解析重疊進行"""
+        blocks: queue.Queue = queue.Queue(maxsize=self.PREFETCH_BLOCKS)
+        stop = threading.Event()
+        end_of_file = object()
+
+        def produce() -> None:
+            try:
+                for item in self._iter_blocks(f, reverse, end):
+                    if stop.is_set():
+                        return
+                    blocks.put(item)
+                blocks.put(end_of_file)
+            except Exception as e:
+                blocks.put(e)
+
+        producer = threading.Thread(target=produce, name="DbfPrefetch", daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = blocks.get()
+                if item is end_of_file:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # 提早結束時(例如已掃過查詢區間)通知預讀執行緒停止，並清空佇列讓它不會卡在put
+            stop.set()
+            while producer.is_alive():
+                try:
+                    blocks.get(timeout=0.05)
+                except queue.Empty:
+                    pass
+            producer.join()
+
+    def iter_raw_fields(self, field_names: List[str], reverse: bool = False) -> Iterator[Tuple[bytes, ...]]:
+        """
+        逐筆讀取指定欄位的原始位元組（不解碼）
+
+        Args:
+            field_names: 需要的欄位名稱，不存在的欄位回傳空位元組
+            reverse: 是否由最後一筆記錄往前讀取
+
+        Yields:
+            依field_names順序排列、已去除填充字元的欄位位元組
+            （含刪除旗標為'*'的記錄，與原本以dbf.Table逐筆讀取的結果一致）
+        """
+        # 不存在的欄位以 (0, 0) 切出空位元組
+        spans = []
+        for name in field_names:
+            offset, length = self.fields.get(name.upper(), (0, 0))
+            spans.append((offset, offset + length))
+        pad = DBF_PAD_BYTES
+
+        with open(self.path, 'rb') as f:
+            for block, bases in self._iter_prefetched_blocks(f, reverse):
+                for base in bases:
+                    yield tuple([block[base + start:base + end].strip(pad) for start, end in spans])
+
+    def iter_raw_fields_matching(self, field_names: List[str], match_field: str, match_value: bytes,
+                                 reverse: bool = False,
+                                 progress: Optional[Callable[[int, int], None]] = None,
+                                 end: Optional[int] = None) -> Iterator[Tuple[bytes, ...]]:
+        """
+        只讀取match_field等於match_value的記錄（例如CO18H中HITEM為BP者）
+
+        以bytes.find在整個區塊中搜尋比對值，再確認落在該欄位內，
+        不符合的記錄完全不進入Python迴圈，適合比對值只佔一部分記錄的情況
+
+        Args:
+            field_names: 需要的欄位名稱，不存在的欄位回傳空位元組
+            match_field: 篩選欄位名稱，不存在時不回傳任何記錄
+            match_value: 篩選值（去除填充字元後比對，不可為空）
+            reverse: 是否由最後一筆記錄往前讀取
+            progress: 每讀完一個區塊呼叫一次 (已掃描筆數, 總筆數)
+            end: 只讀取前end筆記錄（預設為全部）
+
+        Yields:
+            依field_names順序排列、已去除填充字元的欄位位元組
+            （含刪除旗標為'*'的記錄，與原本以dbf.Table逐筆讀取的結果一致）
+        """
+        if match_field.upper() not in self.fields:
+            return
+        match_start, match_length = self.fields[match_field.upper()]
+        match_end = match_start + match_length
+        spans = []
+        for name in field_names:
+            offset, length = self.fields.get(name.upper(), (0, 0))
+            spans.append((offset, offset + length))
+        pad = DBF_PAD_BYTES
+        record_length = self.record_length
+        total = self.record_count if end is None else min(end, self.record_count)
+        scanned = 0
+
+        with open(self.path, 'rb') as f:
+            for block, bases in self._iter_prefetched_blocks(f, reverse, end):
+                scanned += len(bases)
+                if progress is not None:
+                    progress(scanned, total)
+
+                # 找出區塊內符合的記錄起始位移（由前往後）
+                matches = []
+                find = block.find
+                block_end = len(bases) * record_length
+                position = find(match_value)
+                while position != -1 and position < block_end:
+                    base = position - position % record_length
+                    if (base + match_start <= position < base + match_end
+                            and block[base + match_start:base + match_end].strip(pad) == match_value):
+                        matches.append(base)
+                        position = find(match_value, base + record_length)
+                    else:
+                        position = find(match_value, position + 1)
+                if reverse:
+                    matches.reverse()
+
+                for base in matches:
+                    yield tuple([block[base + start:base + end].strip(pad) for start, end in spans])
+
+    def is_date_ordered(self, field_name: str, probe_count: int = 256) -> bool:
+        """
+        抽樣檢查記錄是否依日期欄位遞增排列（新記錄附加在檔尾）
+
+        依記錄順序平均讀取probe_count筆（含第一筆與最後一筆）的日期欄位，
+        略過不是7位數字的日期；有效樣本少於兩筆或出現遞減時視為未排序
+
+        Args:
+            field_name: 日期欄位名稱（民國年 YYYMMDD）
+            probe_count: 抽樣筆數
+
+        Returns:
+            抽樣結果是否依日期遞增
+        """
+        if field_name.upper() not in self.fields or self.record_count < 2:
+            return False
+        offset, length = self.fields[field_name.upper()]
+        last_index = self.record_count - 1
+        probe_count = max(2, min(probe_count, self.record_count))
+        indexes = sorted({last_index * step // (probe_count - 1) for step in range(probe_count)})
+        pad = DBF_PAD_BYTES
+
+        values = []
+        with open(self.path, 'rb') as f:
+            for index in indexes:
+                f.seek(self.header_length + index * self.record_length + offset)
+                value = f.read(length).strip(pad)
+                if len(value) == 7 and value.isdigit():
+                    values.append(value)
+
+        if len(values) < 2:
+            return False
+        return all(previous <= current for previous, current in zip(values, values[1:]))
+
+    def bisect_date_right(self, field_name: str, date_value: bytes) -> Optional[int]:
+        """
+        假設記錄依日期欄位遞增排列（新記錄附加在檔尾），二分搜尋第一筆日期晚於date_value的記錄
+
+        每次探測只讀取該筆記錄的日期欄位；探測到的日期不是同長度的數字，
+        或依記錄順序排列後不是遞增時，視為未排序並回傳None
+
+        Args:
+            field_name: 日期欄位名稱（民國年 YYYMMDD）
+            date_value: 比較的日期位元組
+
+        Returns:
+            第一筆日期大於date_value的記錄索引（全部不大於時為記錄總數），無法判斷時為None
+        """
+        if field_name.upper() not in self.fields or self.record_count == 0:
+            return None
+        offset, length = self.fields[field_name.upper()]
+        header_length = self.header_length
+        record_length = self.record_length
+        pad = DBF_PAD_BYTES
+        probes: Dict[int, bytes] = {}
+
+        with open(self.path, 'rb') as f:
+            def probe(index: int) -> Optional[bytes]:
+                f.seek(header_length + index * record_length + offset)
+                value = f.read(length).strip(pad)
+                if len(value) != len(date_value) or not value.isdigit():
+                    return None
+                probes[index] = value
+                return value
+
+            first = probe(0)
+            last = probe(self.record_count - 1)
+            if first is None or last is None or first > last:
+                return None
+
+            low, high = 0, self.record_count
+            while low < high:
+                middle = (low + high) // 2
+                value = probes.get(middle) or probe(middle)
+                if value is None:
+                    return None
+                if value <= date_value:
+                    low = middle + 1
+                else:
+                    high = middle
+
+        # 所有探測點依記錄順序必須是遞增的，否則檔案並未依日期排列
+        values = [probes[index] for index in sorted(probes)]
+        if any(previous > current for previous, current in zip(values, values[1:])):
+            return None
+        return low
+
+    def iter_fields(self, field_names: List[str], reverse: bool = False) -> Iterator[Tuple[str, ...]]:
+        """
+        逐筆讀取指定欄位
+
+        Args:
+            field_names: 需要的欄位名稱，不存在的欄位回傳空字串
+            reverse: 是否由最後一筆記錄往前讀取
+
+        Yields:
+            依field_names順序排列、已去除前後空白的欄位值（略過無法解碼的記錄）
+        """
+        encoding = self.encoding
+        for values in self.iter_raw_fields(field_names, reverse):
+            try:
+                yield tuple([value.decode(encoding) for value in values])
+            except UnicodeDecodeError:
+                continue
+
+
 class UltraBloodPressureLoader(QObject):
     """超級優化的血壓資料載入器"""
     progress = Signal(int, int)
     finished = Signal(dict)
     error_occurred = Signal(str)  # 新增錯誤信號
     
+    # 由新往舊掃描時，連續這麼多筆早於查詢區間的血壓記錄即視為已掃過區間而提早結束
+    # （只在CO18H抽樣確認依日期排列時啟用）
+    EARLY_EXIT_STREAK = 4096
+    
+    # 沒有血壓記錄的病患的空記錄樣板（唯讀；每次載入複製一份使用）
+    EMPTY_RECORD = MappingProxyType({
+        'systolic': None,
+        'diastolic': None,
+        'date': None,
+        'time': None,
+        'hdate': None,
+        'htime': None,
+        'value': None
+    })
+    
     def __init__(self, co18h_path: str, patient_ids: List[str], years_limit: float = None, start_date=None, end_date=None):
         super().__init__()
         self.co18h_path = co18h_path
-        self.patient_set = {normalize_patient_id(pid) for pid in patient_ids}
+        # 病歷號在讀取VISHFAM時已統一為7位數格式，不需再逐一正規化
+        self.patient_set = set(patient_ids)
+        self.patient_list: List[str] = sorted(self.patient_set)  # 病患索引順序
+        # 預先編碼的病歷號位元組 -> 病患索引，掃描時直接以原始位元組查詢
+        self.patient_bytes_map: Dict[bytes, int] = {
+            pid.encode(DBF_ENCODING): index for index, pid in enumerate(self.patient_list)
+        }
         self.years_limit = years_limit
         self.start_date = start_date
         self.end_date = end_date
@@ -219,130 +678,142 @@ class UltraBloodPressureLoader(QObject):
                 logger.debug(f"起始日期限制字串: {date_limit_str}")
                 logger.debug(f"結束日期限制字串: {end_date_str}")
             
-            # 使用字典快速儲存每個病患的最新血壓
-            bp_data = {}
-            patients_found = 0  # 已找到血壓記錄的病患數量
-            target_patients = len(self.patient_set)
-            
-            for pid in self.patient_set:
-                bp_data[pid] = {
-                    'systolic': None,
-                    'diastolic': None,
-                    'date': None,
-                    'time': None,
-                    'hdate': None,  # 保存原始日期格式
-                    'htime': None,  # 保存原始時間格式
-                    'value': None,
-                    'datetime_str': '',
-                    'found': False  # 是否已找到該病患的血壓記錄
-                }
+            # 每位病患的最新血壓以平行串列儲存（依病患索引），掃描時只更新對應位置
+            patient_count = len(self.patient_list)
+            best_datetime = [b''] * patient_count  # 日期+時間原始位元組，用於比較新舊；空值表示尚無記錄
+            best_systolic = array('H', [0]) * patient_count
+            best_diastolic = array('H', [0]) * patient_count
+            best_hdate = [None] * patient_count  # 原始日期格式
+            best_htime = [None] * patient_count  # 原始時間格式
+            best_value = [None] * patient_count
             
-            table = dbf.Table(self.co18h_path)
-            table.open()
+            reader = DbfRawReader(self.co18h_path)
             
-            processed = 0
-            date_filtered = 0  # 通過日期篩選的記錄數
+            scanned = [0]  # 已掃描的記錄數（含非血壓記錄），由進度回呼更新
             bp_found = 0
+            date_filtered = 0  # 通過日期篩選的血壓記錄數
             patient_matched = 0  # 病患匹配的記錄數
-            matched = 0
-            total_records = len(table)
-            last_emit = time.time()
-            batch_size = 1000  # 批次處理
+            total_records = len(reader)
+            
+            def report_progress(done: int, total: int) -> None:
+                # 每讀完一個區塊回報一次進度
+                scanned[0] = done
+                self.progress.emit(done, total)
             
             logger.info(f"開始掃描 {total_records} 筆記錄，日期限制: {date_limit_str}...")
             
+            # 日期以位元組直接比較，不需逐筆解碼（民國年 YYYMMDD 為ASCII數字）
+            date_limit_bytes = date_limit_str.encode('ascii')
+            end_date_bytes = end_date_str.encode('ascii')
+            
             # 記錄前幾筆的日期資料作為參考
             sample_dates = []
+            older_streak = 0  # 連續早於起始日期的記錄數
+            early_exit = False
             
-            for record in table:
-                # 批次更新進度，減少UI更新頻率
-                if processed % batch_size == 0 and time.time() - last_emit > 0.5:
-                    self.progress.emit(processed, total_records)
-                    last_emit = time.time()
-                
-                processed += 1
+            # 只讀取HITEM為BP的記錄（在區塊中直接搜尋，其他檢驗項目不進入迴圈），
+            # 且只取篩選需要的四個欄位的原始位元組，通過前一級篩選才解碼
+            # 新記錄附加在檔尾，由檔尾往前掃描
+            encoding = reader.encoding
+            patient_bytes_map = self.patient_bytes_map
+            # 迴圈內使用的常數先綁定為區域變數
+            sys_min, sys_max = _SYSTOLIC_MIN, _SYSTOLIC_MAX
+            dia_min, dia_max = _DIASTOLIC_MIN, _DIASTOLIC_MAX
+            # 提早結束與二分搜尋都假設新記錄附加在檔尾；檔案未依日期排列時
+            # （例如補登的舊記錄附加在檔尾）停用兩者，完整掃描以免漏掉區間內的記錄
+            date_ordered = reader.is_date_ordered('HDATE')
+            if date_ordered:
+                early_exit_streak = self.EARLY_EXIT_STREAK
+            else:
+                early_exit_streak = total_records + 1  # 不會達到，等同停用提早結束
+                logger.info("- CO18H未依日期排列，完整掃描所有記錄")
+            # 只有自訂區間模式檢查結束日期；預設範圍模式以不會出現的最大值代替，省去逐筆判斷模式
+            date_upper_bytes = end_date_bytes if self.years_limit is None else b'9999999'
+            
+            # 自訂區間的結束日期早於檔尾時，依日期二分搜尋略過檔尾較新的記錄；
+            # 邊界再往後多讀一段，容許檔尾附近少量未依日期排列的記錄
+            scan_end = None
+            if self.years_limit is None and date_ordered:
+                bound = reader.bisect_date_right('HDATE', end_date_bytes)
+                if bound is not None and bound < total_records:
+                    scan_end = min(total_records, bound + self.EARLY_EXIT_STREAK)
+                    logger.info(f"- 依日期二分搜尋略過檔尾 {total_records - scan_end} 筆晚於結束日期的記錄")
+            
+            fields = ['HDATE', 'KCSTMR', 'HVAL', 'HTIME']
+            bp_records = reader.iter_raw_fields_matching(fields, 'HITEM', b'BP', reverse=True,
+                                                         progress=report_progress, end=scan_end)
+            for raw_date, raw_kcstmr, raw_hval, raw_time in bp_records:
+                bp_found += 1
                 
                 try:
-                    # 第一級篩選：日期範圍（最能快速排除大量記錄）
-                    # 優化：先快速檢查日期格式，避免不必要的字串操作
-                    try:
-                        record_date = str(record.HDATE).strip()
-
-                        # 收集前10筆記錄的日期作為參考
-                        if len(sample_dates) < 10:
-                            sample_dates.append(record_date)
+                    # 第一級篩選：日期範圍
+                    # 收集前10筆記錄的日期作為參考
+                    if len(sample_dates) < 10:
+                        sample_dates.append(raw_date.decode(encoding, 'replace'))
 
-                        # 嚴格檢查日期格式：必須是7位數字
-                        if len(record_date) != 7 or not record_date.isdigit():
-                            continue
-
-                        # 快速字串比較（民國年格式 YYYMMDD）
-                        # 使用 < 確保只保留在限制日期之後（含當日）的記錄
-                        if record_date < date_limit_str:
-                            continue
+                    # 嚴格檢查日期格式：必須是7位數字
+                    if len(raw_date) != 7 or not raw_date.isdigit():
+                        continue
 
-                        # 自訂區間模式：檢查結束日期（含當日）
-                        if self.years_limit is None and record_date > end_date_str:
-                            continue
-                    except Exception:
+                    # 快速位元組比較（民國年格式 YYYMMDD），起訖日皆含當日
+                    if raw_date < date_limit_bytes:
+                        # 連續大量血壓記錄都早於區間，之前的記錄只會更舊，不需再掃描
+                        older_streak += 1
+                        if older_streak >= early_exit_streak:
+                            early_exit = True
+                            logger.info(f"- 連續 {early_exit_streak} 筆血壓記錄早於起始日期，提早結束掃描")
+                            break
                         continue
-                    
-                    date_filtered += 1
-                    
-                    # 第二級篩選：檢查HITEM（只處理血壓記錄）
-                    hitem = str(record.HITEM).strip()
-                    if hitem != 'BP':
+                    older_streak = 0
+                    if raw_date > date_upper_bytes:
                         continue
                     
-                    bp_found += 1
+                    date_filtered += 1
                     
-                    # 第三級篩選：檢查病歷號（只處理目標病患）
-                    patient_id = normalize_patient_id(str(record.KCSTMR))
-                    if patient_id not in self.patient_set:
+                    # 第二級篩選：檢查病歷號（只處理目標病患）
+                    index = patient_bytes_map.get(raw_kcstmr.zfill(7))
+                    if index is None:
                         continue
                         
                     patient_matched += 1
                     
+                    # 先以日期+時間位元組比較新舊：只保留最新的記錄（反向掃描，同時間以檔案中較前面的記錄為準）
+                    # 較舊的記錄不可能勝出，直接略過，不必解析血壓值
+                    datetime_key = raw_date + raw_time
+                    previous = best_datetime[index]
+                    if previous and datetime_key < previous:
+                        continue
+                    
                     # 解析血壓值
-                    hval = str(record.HVAL).strip()
-                    if '/' not in hval:
+                    if b'/' not in raw_hval:
                         continue
                     
-                    # 快速解析血壓值
+                    # 快速解析血壓值：直接由位元組轉整數，帶小數點時才退回float並截斷
                     try:
-                        systolic_str, diastolic_str = hval.split('/', 1)
-                        systolic = int(float(systolic_str))
-                        diastolic = int(float(diastolic_str))
-
-                        # 驗證血壓數值範圍
-                        if not (BloodPressureRange.SYSTOLIC_MIN <= systolic <= BloodPressureRange.SYSTOLIC_MAX and
-                                BloodPressureRange.DIASTOLIC_MIN <= diastolic <= BloodPressureRange.DIASTOLIC_MAX):
+                        systolic_raw, diastolic_raw = raw_hval.split(b'/', 1)
+                        try:
+                            systolic = int(systolic_raw)
+                            diastolic = int(diastolic_raw)
+                        except ValueError:
+                            systolic = int(float(systolic_raw))
+                            diastolic = int(float(diastolic_raw))
+
+                        # 驗證血壓數值範圍（不合理的數值不取代已保存的記錄）
+                        if not (sys_min <= systolic <= sys_max and dia_min <= diastolic <= dia_max):
                             continue
                         
-                        # 建立日期時間字串用於比較
-                        time_str = str(record.HTIME).strip()
-                        datetime_str = record_date + time_str
+                        # 只有勝出的記錄才解碼；全部解碼成功後才一起寫入，
+                        # 避免解碼失敗時留下只更新一半的記錄
+                        hdate = raw_date.decode('ascii')
+                        htime = raw_time.decode(encoding)
+                        value = raw_hval.decode(encoding)
                         
-                        # 只保留最新的記錄
-                        patient_bp = bp_data[patient_id]
-                        if not patient_bp['datetime_str'] or datetime_str > patient_bp['datetime_str']:
-                            # 如果是第一次找到該病患的血壓記錄
-                            if not patient_bp['found']:
-                                patient_bp['found'] = True
-                                patients_found += 1
-                            
-                            patient_bp['systolic'] = systolic
-                            patient_bp['diastolic'] = diastolic
-                            patient_bp['date'] = record_date
-                            patient_bp['time'] = time_str
-                            patient_bp['hdate'] = record_date  # 保存原始日期
-                            patient_bp['htime'] = time_str  # 保存原始時間
-                            patient_bp['value'] = hval
-                            patient_bp['datetime_str'] = datetime_str
-                            matched += 1
-                        
-                        # 優化：如果已經找到所有病患的最新記錄，可以提早結束
-                        # （但通常我們還是要掃描完畢以確保真的是最新記錄）
+                        best_datetime[index] = datetime_key
+                        best_systolic[index] = systolic
+                        best_diastolic[index] = diastolic
+                        best_hdate[index] = hdate
+                        best_htime[index] = htime
+                        best_value[index] = value
                         
                     except (ValueError, IndexError):
                         continue
@@ -350,44 +821,35 @@ class UltraBloodPressureLoader(QObject):
                 except Exception:
                     continue
             
-            table.close()
-            
-            # 清理空資料和統計
-            final_data = {}
-            patients_with_bp = 0
-            
-            for pid, data in bp_data.items():
-                if data['systolic']:
-                    patients_with_bp += 1
-                    final_data[pid] = {
-                        'systolic': data['systolic'],
-                        'diastolic': data['diastolic'],
-                        'date': data['date'],
-                        'time': data['time'],
-                        'hdate': data.get('hdate', data['date']),
-                        'htime': data.get('htime', data['time']),
-                        'value': data['value']
-                    }
-                else:
-                    final_data[pid] = {
-                        'systolic': None,
-                        'diastolic': None,
-                        'date': None,
-                        'time': None,
-                        'hdate': None,
-                        'htime': None,
-                        'value': None
-                    }
+            # 一次組出結果：只有找到記錄的病患建立新字典；
+            # 沒有記錄的病患共用本次載入複製的空記錄，不與其他次載入的結果共用
+            empty_record = dict(self.EMPTY_RECORD)
+            final_data = {
+                pid: {
+                    'systolic': best_systolic[index],
+                    'diastolic': best_diastolic[index],
+                    'date': best_hdate[index],
+                    'time': best_htime[index],
+                    'hdate': best_hdate[index],
+                    'htime': best_htime[index],
+                    'value': best_value[index]
+                } if best_datetime[index] else empty_record
+                for index, pid in enumerate(self.patient_list)
+            }
+            patients_with_bp = patient_count - best_datetime.count(b'')
             
             logger.info(f"掃描完成！篩選效果分析:")
             logger.info(f"- 總記錄: {total_records}")
+            if early_exit:
+                logger.info(f"- 已越過查詢區間，提早結束: 掃描 {scanned[0]} 筆")
             if sample_dates:
-                logger.debug(f"- 前10筆記錄日期樣本: {sample_dates}")
-            logger.info(f"- 通過日期篩選: {date_filtered} ({date_filtered/total_records*100:.1f}%)")
-            if date_filtered > 0:
-                logger.info(f"- BP記錄: {bp_found} ({bp_found/date_filtered*100:.1f}% of date filtered)")
-                if bp_found > 0:
-                    logger.info(f"- 病患匹配: {patient_matched} ({patient_matched/bp_found*100:.1f}% of BP records)")
+                logger.debug(f"- 前10筆血壓記錄日期樣本: {sample_dates}")
+            if scanned[0] > 0:
+                logger.info(f"- BP記錄: {bp_found} ({bp_found/scanned[0]*100:.1f}% of scanned)")
+            if bp_found > 0:
+                logger.info(f"- 通過日期篩選: {date_filtered} ({date_filtered/bp_found*100:.1f}% of BP records)")
+                if date_filtered > 0:
+                    logger.info(f"- 病患匹配: {patient_matched} ({patient_matched/date_filtered*100:.1f}% of date filtered)")
             logger.info(f"- 最終有血壓病患: {patients_with_bp}")
             
             self.finished.emit(final_data)
@@ -408,7 +870,337 @@ class UltraBloodPressureLoader(QObject):
             self.error_occurred.emit(error_msg)
 
 
-class UltraPatientTableWidget(QTableWidget):
+class PatientRecord:
+    """VISHFAM病患資料 - 以__slots__儲存，名單較大時比字典節省記憶體"""
+
+    __slots__ = ('pat_pid', 'pat_id', 'pat_namec', 'reg_date')
+
+    def __init__(self, pat_pid: str, pat_id: str = '', pat_namec: str = '', reg_date: str = ''):
+        self.pat_pid = pat_pid  # 統一格式的7位數病歷號
+        self.pat_id = pat_id
+        self.pat_namec = pat_namec
+        self.reg_date = reg_date
+
+    def to_dict(self) -> Dict:
+        """轉為匯出使用的字典，只在匯出勾選的病患時呼叫"""
+        return {
+            'pat_pid': self.pat_pid,
+            'pat_id': self.pat_id,
+            'pat_namec': self.pat_namec,
+            'reg_date': self.reg_date,
+        }
+
+
+def read_vishfam(vishfam_path: str) -> List[PatientRecord]:
+    """讀取VISHFAM病患名單 (於背景執行緒呼叫)"""
+    patients = []
+    seen_pids = set()  # 用於去重
+    
+    try:
+        reader = DbfRawReader(vishfam_path)
+        total_records = len(reader)
+        duplicates_found = 0
+        
+        encoding = reader.encoding
+        empty_pid = b'0000000'
+        
+        # 以原始位元組去重，重複記錄不需解碼姓名等欄位
+        fields = ['PAT_PID', 'PAT_ID', 'PAT_NAMEC', 'REG_DATE']
+        for raw_pid, raw_id, raw_namec, raw_reg_date in reader.iter_raw_fields(fields):
+            if not raw_pid:
+                continue
+            
+            # 統一格式後再去重，'12' 與 '0000012' 視為同一位病患
+            raw_pid = normalize_patient_id(raw_pid)
+            if raw_pid == empty_pid:
+                continue
+            if raw_pid in seen_pids:
+                duplicates_found += 1
+                continue
+            
+            try:
+                patient = PatientRecord(
+                    raw_pid.decode(encoding),
+                    raw_id.decode(encoding),
+                    raw_namec.decode(encoding),
+                    raw_reg_date.decode(encoding),
+                )
+            except UnicodeDecodeError:
+                # 無法解碼的記錄略過，且不佔用病歷號，後續同號記錄仍可採用
+                continue
+            seen_pids.add(raw_pid)
+            patients.append(patient)
+        
+        logger.info(f"VISHFAM掃描完成:")
+        logger.info(f"- 總記錄: {total_records}")
+        logger.info(f"- 重複記錄: {duplicates_found}")
+        logger.info(f"- 最終病患: {len(patients)}")
+        
+    except Exception as e:
+        raise Exception(f"讀取VISHFAM.DBF失敗: {str(e)}")
+    
+    return patients
+
+
+def read_co01m_birth_dates(co01m_path: str) -> Dict[str, str]:
+    """讀取CO01M.DBF的出生日期，回傳 {7位數病歷號: 出生日期}"""
+    # 只需KCSTMR與MBIRTHDT兩欄，直接以原始讀取器切割記錄，不經dbf模組逐筆轉型
+    reader = DbfRawReader(co01m_path)
+    return {
+        pid.zfill(7): birth_date
+        for pid, birth_date in reader.iter_fields(['KCSTMR', 'MBIRTHDT'])
+        if pid and birth_date
+    }
+
+
+def read_co03l_visit_dates(co03l_path: str) -> Dict[Tuple[str, str], str]:
+    """讀取co03l.dbf的edate，回傳 {(7位數病歷號, 測量日期): edate}"""
+    reader = DbfRawReader(co03l_path)
+    # 欄位是否存在只需檢查一次；缺少HDATE時原始讀取器會回傳空字串
+    if 'KCSTMR' not in reader.fields or 'EDATE' not in reader.fields:
+        return {}
+    # 建立key為 (pid, date) 的索引
+    return {
+        (pid.zfill(7), hdate): edate
+        for pid, hdate, edate in reader.iter_fields(['KCSTMR', 'HDATE', 'EDATE'])
+        if edate
+    }
+
+
+class PatientTableModel(QAbstractTableModel):
+    """病患表格資料模型 - 只在繪製可見列時才產生顯示資料"""
+
+    check_toggled = Signal(int, bool)  # 勾選狀態變更 (列, 是否勾選)
+    bp_value_edited = Signal(int)  # 血壓值變更 (列)
+
+    HEADERS = ["選擇", "病歷號", "姓名", "身分證", "收縮壓", "舒張壓", "測量日期", "狀態"]
+    COL_CHECK = 0
+    COL_PID = 1
+    COL_NAME = 2
+    COL_ID = 3
+    COL_SYSTOLIC = 4
+    COL_DIASTOLIC = 5
+    COL_DATE = 6
+    COL_STATUS = 7
+
+    # 狀態欄位 (文字, 背景) - 共用同一組QBrush，繪製時不再逐格建立
+    STATUS_SELECTED_WITH_BP = ("已選擇", QBrush(QColor(200, 255, 200)))  # 綠色
+    STATUS_SELECTED = ("已選擇", QBrush(QColor(200, 200, 255)))  # 藍色
+    STATUS_HAS_DATA = ("有資料", QBrush(QColor(255, 255, 200)))  # 黃色
+    STATUS_PENDING = ("待輸入", QBrush(QColor(240, 240, 240)))  # 灰色
+
+    # 血壓欄位提示文字
+    SYSTOLIC_TOOLTIP = (f"收縮壓合理範圍: {BloodPressureRange.SYSTOLIC_MIN}-"
+                        f"{BloodPressureRange.SYSTOLIC_MAX} {HealthInsuranceCode.BP_UNIT}")
+    DIASTOLIC_TOOLTIP = (f"舒張壓合理範圍: {BloodPressureRange.DIASTOLIC_MIN}-"
+                         f"{BloodPressureRange.DIASTOLIC_MAX} {HealthInsuranceCode.BP_UNIT}")
+
+    def __init__(self, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self._patients: List[PatientRecord] = []
+        self._checked = bytearray()  # 勾選狀態，每列一個位元組
+        self._systolic = array('H')  # 收縮壓欄位 (連續記憶體)
+        self._diastolic = array('H')  # 舒張壓欄位 (連續記憶體)
+        self._dates: List[str] = []
+
+    def reset_rows(self, patients: List[PatientRecord], checked: List[bool], systolic: List[int],
+                   diastolic: List[int], dates: List[str]) -> None:
+        """整批替換表格資料，只觸發一次模型重設"""
+        self.beginResetModel()
+        self._patients = patients
+        self._checked = bytearray(checked)
+        self._systolic = array('H', systolic)
+        self._diastolic = array('H', diastolic)
+        self._dates = dates
+        self.endResetModel()
+
+    def update_rows(self, patients: List[PatientRecord], checked: List[bool], systolic: List[int],
+                    diastolic: List[int], dates: List[str]) -> None:
+        """列數與病歷號順序不變時原地替換資料，只發出一次資料變更，保留捲動、選取與篩選狀態"""
+        if len(patients) != len(self._patients):
+            self.reset_rows(patients, checked, systolic, diastolic, dates)
+            return
+
+        self._patients = patients
+        self._checked = bytearray(checked)
+        self._systolic = array('H', systolic)
+        self._diastolic = array('H', diastolic)
+        self._dates = dates
+        if patients:
+            self.dataChanged.emit(self.index(0, 0),
+                                  self.index(len(patients) - 1, len(self.HEADERS) - 1))
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._patients)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlag:
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+
+        flags = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+        column = index.column()
+        if column == self.COL_CHECK:
+            flags |= Qt.ItemFlag.ItemIsUserCheckable
+        elif column in (self.COL_SYSTOLIC, self.COL_DIASTOLIC):
+            flags |= Qt.ItemFlag.ItemIsEditable
+        return flags
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+
+        row = index.row()
+        column = index.column()
+
+        if role == Qt.ItemDataRole.DisplayRole or role == Qt.ItemDataRole.EditRole:
+            if column == self.COL_PID:
+                return self._patients[row].pat_pid
+            if column == self.COL_NAME:
+                return self._patients[row].pat_namec
+            if column == self.COL_ID:
+                return self._patients[row].pat_id
+            if column == self.COL_SYSTOLIC:
+                return self._systolic[row]
+            if column == self.COL_DIASTOLIC:
+                return self._diastolic[row]
+            if column == self.COL_DATE:
+                return self._dates[row]
+            if column == self.COL_STATUS:
+                return self._status(row)[0]
+            return None
+
+        if role == Qt.ItemDataRole.CheckStateRole and column == self.COL_CHECK:
+            return Qt.CheckState.Checked if self._checked[row] else Qt.CheckState.Unchecked
+
+        if role == Qt.ItemDataRole.BackgroundRole and column == self.COL_STATUS:
+            return self._status(row)[1]
+
+        if role == Qt.ItemDataRole.ToolTipRole:
+            if column == self.COL_SYSTOLIC:
+                return self.SYSTOLIC_TOOLTIP
+            if column == self.COL_DIASTOLIC:
+                return self.DIASTOLIC_TOOLTIP
+
+        return None
+
+    def setData(self, index: QModelIndex, value, role: int = Qt.ItemDataRole.EditRole) -> bool:
+        if not index.isValid():
+            return False
+
+        row = index.row()
+        column = index.column()
+
+        if column == self.COL_CHECK and role == Qt.ItemDataRole.CheckStateRole:
+            self.set_checked(row, Qt.CheckState(value) == Qt.CheckState.Checked)
+            return True
+
+        if column in (self.COL_SYSTOLIC, self.COL_DIASTOLIC) and role == Qt.ItemDataRole.EditRole:
+            try:
+                new_value = int(value)
+            except (TypeError, ValueError):
+                return False
+
+            # 與原本SpinBox相同的輸入範圍
+            if column == self.COL_SYSTOLIC:
+                values, max_value = self._systolic, BloodPressureRange.SYSTOLIC_MAX
+            else:
+                values, max_value = self._diastolic, BloodPressureRange.DIASTOLIC_MAX
+            if not 0 <= new_value <= max_value:
+                return False
+
+            if values[row] != new_value:
+                values[row] = new_value
+                self.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole])
+                self._emit_status_changed(row)
+                self.bp_value_edited.emit(row)
+            return True
+
+        return False
+
+    def is_checked(self, row: int) -> bool:
+        """是否勾選"""
+        return bool(self._checked[row])
+
+    def set_checked(self, row: int, checked: bool, notify: bool = True) -> None:
+        """設定單一列的勾選狀態"""
+        if self._checked[row] == checked:
+            return
+
+        self._checked[row] = checked
+        check_index = self.index(row, self.COL_CHECK)
+        self.dataChanged.emit(check_index, check_index, [Qt.ItemDataRole.CheckStateRole])
+        self._emit_status_changed(row)
+        if notify:
+            self.check_toggled.emit(row, checked)
+
+    def set_all_checked(self, checked: bool) -> None:
+        """整批設定勾選狀態，只發出一次資料變更"""
+        if not self._checked:
+            return
+
+        self._checked[:] = bytes([checked]) * len(self._checked)
+        last_row = len(self._checked) - 1
+        self.dataChanged.emit(self.index(0, self.COL_CHECK), self.index(last_row, self.COL_CHECK),
+                              [Qt.ItemDataRole.CheckStateRole])
+        self.dataChanged.emit(self.index(0, self.COL_STATUS), self.index(last_row, self.COL_STATUS),
+                              [Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.BackgroundRole])
+
+    def bp_values(self, row: int) -> Tuple[int, int]:
+        """取得目前的收縮壓與舒張壓"""
+        return self._systolic[row], self._diastolic[row]
+
+    def checked_rows(self) -> List[int]:
+        """依列順序回傳所有勾選的列"""
+        return list(compress(range(len(self._checked)), self._checked))
+
+    def _status(self, row: int) -> Tuple[str, QBrush]:
+        """依勾選狀態與血壓值決定狀態文字和背景"""
+        has_bp_values = self._systolic[row] > 0 or self._diastolic[row] > 0
+
+        if self._checked[row]:
+            if has_bp_values:
+                return self.STATUS_SELECTED_WITH_BP
+            return self.STATUS_SELECTED
+        if has_bp_values:
+            return self.STATUS_HAS_DATA
+        return self.STATUS_PENDING
+
+    def _emit_status_changed(self, row: int) -> None:
+        status_index = self.index(row, self.COL_STATUS)
+        self.dataChanged.emit(status_index, status_index,
+                              [Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.BackgroundRole])
+
+
+class BloodPressureSpinDelegate(QStyledItemDelegate):
+    """血壓欄位編輯器 - 只在編輯儲存格時建立SpinBox"""
+
+    def __init__(self, max_value: int, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self.max_value = max_value
+
+    def createEditor(self, parent: QWidget, option, index: QModelIndex) -> QWidget:
+        editor = QSpinBox(parent)
+        editor.setRange(0, self.max_value)
+        editor.setFrame(False)
+        return editor
+
+    def setEditorData(self, editor: QWidget, index: QModelIndex) -> None:
+        editor.setValue(int(index.data(Qt.ItemDataRole.EditRole) or 0))
+
+    def setModelData(self, editor: QWidget, model: QAbstractTableModel, index: QModelIndex) -> None:
+        editor.interpretText()
+        model.setData(index, editor.value(), Qt.ItemDataRole.EditRole)
+
+
+class UltraPatientTableWidget(QTableView):
     """超級優化的病患表格"""
     
     data_changed = Signal()
@@ -416,23 +1208,35 @@ class UltraPatientTableWidget(QTableWidget):
     
     def __init__(self):
         super().__init__()
+        self.patient_model = PatientTableModel(self)
+        self.patient_model.check_toggled.connect(self.on_checkbox_changed)
+        self.patient_model.bp_value_edited.connect(self.on_bp_value_changed)
+        self.setModel(self.patient_model)
+        # 血壓欄位使用與原本SpinBox相同範圍的編輯器
+        self.setItemDelegateForColumn(PatientTableModel.COL_SYSTOLIC,
+                                      BloodPressureSpinDelegate(BloodPressureRange.SYSTOLIC_MAX, self))
+        self.setItemDelegateForColumn(PatientTableModel.COL_DIASTOLIC,
+                                      BloodPressureSpinDelegate(BloodPressureRange.DIASTOLIC_MAX, self))
         self.setup_table()
         self.selected_patients = set()
         self.patient_data = []
+        self.normalized_pids: List[str] = []  # 各列統一格式的病患編號
+        self.patient_index: Dict[str, int] = {}  # 統一格式病患編號 -> 首次出現的列
+        self.search_index: List[Tuple[str, str]] = []  # 各列小寫的(病歷號, 姓名)，供搜尋篩選
+        self._populated_pids: Optional[List[str]] = None  # 模型目前各列的病患編號
         self.bp_data = {}
-        self.dbf_folder = ""  # 儲存DBF資料夾路徑
-        self._updating = False  # 防止遞迴更新
         
     def setup_table(self) -> None:
         """設定表格"""
-        headers = ["選擇", "病歷號", "姓名", "身分證", "收縮壓", "舒張壓", "測量日期", "狀態"]
-        self.setColumnCount(len(headers))
-        self.setHorizontalHeaderLabels(headers)
-        
-        self.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
         self.setAlternatingRowColors(True)
+        self.setEditTriggers(QTableView.EditTrigger.DoubleClicked |
+                             QTableView.EditTrigger.SelectedClicked |
+                             QTableView.EditTrigger.EditKeyPressed |
+                             QTableView.EditTrigger.AnyKeyPressed)
         
-        # 設定行高來配合SpinBox
+        # 固定行高，避免依內容重新計算每一列高度
+        self.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
         self.verticalHeader().setDefaultSectionSize(35)
         
         # 優化欄位寬度 - 移除原始值欄位，加大血壓欄位
@@ -440,61 +1244,22 @@ class UltraPatientTableWidget(QTableWidget):
         for i, width in enumerate(widths):
             self.setColumnWidth(i, width)
     
-    def load_vishfam(self, vishfam_path: str) -> List[str]:
-        """載入VISHFAM資料"""
-        patients = []
-        patient_ids = []
-        seen_pids = set()  # 用於去重
-        
-        # 設定DBF資料夾路徑
-        self.dbf_folder = os.path.dirname(vishfam_path)
-        
-        try:
-            table = dbf.Table(vishfam_path)
-            table.open()
-            total_records = len(table)
-            duplicates_found = 0
-            
-            for record in table:
-                try:
-                    pat_pid = str(getattr(record, 'PAT_PID', '')).strip()
-                    if not pat_pid or pat_pid == '0000000':
-                        continue
-                    
-                    # 去重檢查
-                    if pat_pid in seen_pids:
-                        duplicates_found += 1
-                        continue
-                    seen_pids.add(pat_pid)
-                    
-                    patient = {
-                        'pat_pid': pat_pid,
-                        'pat_id': str(getattr(record, 'PAT_ID', '')).strip(),
-                        'pat_namec': str(getattr(record, 'PAT_NAMEC', '')).strip(),
-                        'reg_date': str(getattr(record, 'REG_DATE', '')).strip(),
-                    }
-                    
-                    patients.append(patient)
-                    patient_ids.append(pat_pid)
-                    
-                except Exception:
-                    continue
-            
-            table.close()
-            
-            logger.info(f"VISHFAM掃描完成:")
-            logger.info(f"- 總記錄: {total_records}")
-            logger.info(f"- 重複記錄: {duplicates_found}")
-            logger.info(f"- 最終病患: {len(patients)}")
-
-            self.patient_data = patients
-            logger.debug(f"Patient data assigned: {len(self.patient_data)} patients")
-            # 不在這裡populate_table，等待血壓資料載入完成後再一起處理
-            
-        except Exception as e:
-            raise Exception(f"讀取VISHFAM.DBF失敗: {str(e)}")
-        
-        return patient_ids
+    def set_patient_data(self, patients: List[PatientRecord]) -> List[str]:
+        """設定已讀取的VISHFAM病患名單，回傳病患編號清單"""
+        self.patient_data = patients
+        # 病歷號在讀取VISHFAM時已統一格式，之後的勾選/統計直接查表
+        self.normalized_pids = [sys.intern(patient.pat_pid) for patient in patients]
+        self.patient_index = {}
+        for row, pid in enumerate(self.normalized_pids):
+            self.patient_index.setdefault(pid, row)
+        # 搜尋時每次按鍵都要比對全部病患，小寫字串先建好
+        self.search_index = [
+            (patient.pat_pid.lower(), patient.pat_namec.lower())
+            for patient in patients
+        ]
+        logger.debug(f"Patient data assigned: {len(self.patient_data)} patients")
+        # 不在這裡populate_table，等待血壓資料載入完成後再一起處理
+        return [patient.pat_pid for patient in patients]
     
     def update_blood_pressure_data(self, bp_data: Dict[str, Dict]) -> None:
         """更新血壓資料"""
@@ -503,29 +1268,20 @@ class UltraPatientTableWidget(QTableWidget):
     
     def populate_table(self) -> None:
         """填充表格"""
-        self._updating = True
-        
-        # 先完全清空表格
-        self.clearContents()
-        self.setRowCount(0)
-        
-        # 再設定正確的行數
-        self.setRowCount(len(self.patient_data))
-
-        logger.debug(f"Table refill: patients={len(self.patient_data)}, rows={self.rowCount()}")
+        logger.debug(f"Table refill: patients={len(self.patient_data)}")
         
         # 清空之前的選擇狀態
         self.selected_patients.clear()
         auto_selected = 0  # 統計自動選擇的數量
         
-        for row, patient in enumerate(self.patient_data):
-            patient_id = patient['pat_pid']
-            bp_info = self.bp_data.get(patient_id.zfill(7), {})
-            
-            # 將血壓資料的時間資訊加入patient資料中
-            if bp_info:
-                patient['hdate'] = bp_info.get('hdate')
-                patient['htime'] = bp_info.get('htime')
+        checked = []
+        systolic_values = []
+        diastolic_values = []
+        dates = []
+        
+        for normalized_pid in self.normalized_pids:
+            # 血壓的日期時間留在bp_data，匯出時才併入該列的病患資料
+            bp_info = self.bp_data.get(normalized_pid, {})
             
             # 判斷是否有血壓資料 (必須收縮壓和舒張壓都大於0)
             systolic = bp_info.get('systolic') or 0
@@ -533,73 +1289,27 @@ class UltraPatientTableWidget(QTableWidget):
             has_bp_data = (systolic > 0 and diastolic > 0)
             
             # 選擇框 - 如果有血壓資料則自動勾選
-            checkbox = QCheckBox()
+            checked.append(has_bp_data)
             if has_bp_data:
-                checkbox.setChecked(True)
                 # 使用統一格式的patient_id防止重複
-                normalized_pid = normalize_patient_id(patient_id)
                 self.selected_patients.add(normalized_pid)
                 auto_selected += 1
             
-            checkbox.stateChanged.connect(lambda state, r=row: self.on_checkbox_changed(r, state))
-            self.setCellWidget(row, 0, checkbox)
+            # 血壓值 - 可直接在表格中編輯
+            systolic_values.append(systolic)
+            diastolic_values.append(diastolic)
             
-            # 基本資料
-            self.setItem(row, 1, QTableWidgetItem(patient_id))
-            self.setItem(row, 2, QTableWidgetItem(patient.get('pat_namec', '')))
-            self.setItem(row, 3, QTableWidgetItem(patient.get('pat_id', '')))
-            
-            # 血壓值 - 可編輯的SpinBox，設定合理範圍
-            systolic_spin = QSpinBox()
-            systolic_spin.setRange(0, BloodPressureRange.SYSTOLIC_MAX)
-            systolic_spin.setMinimumHeight(28)
-            systolic_spin.setMinimumWidth(100)
-            systolic_spin.setToolTip(f"收縮壓合理範圍: {BloodPressureRange.SYSTOLIC_MIN}-{BloodPressureRange.SYSTOLIC_MAX} {HealthInsuranceCode.BP_UNIT}")
-            if bp_info.get('systolic'):
-                systolic_spin.setValue(bp_info['systolic'])
-
-            # 連接變更事件，實現自動勾選功能
-            systolic_spin.valueChanged.connect(lambda v, r=row: self.on_bp_value_changed(r))
-            self.setCellWidget(row, 4, systolic_spin)
-
-            diastolic_spin = QSpinBox()
-            diastolic_spin.setRange(0, BloodPressureRange.DIASTOLIC_MAX)
-            diastolic_spin.setMinimumHeight(28)
-            diastolic_spin.setMinimumWidth(100)
-            diastolic_spin.setToolTip(f"舒張壓合理範圍: {BloodPressureRange.DIASTOLIC_MIN}-{BloodPressureRange.DIASTOLIC_MAX} {HealthInsuranceCode.BP_UNIT}")
-            if bp_info.get('diastolic'):
-                diastolic_spin.setValue(bp_info['diastolic'])
-            
-            diastolic_spin.valueChanged.connect(lambda v, r=row: self.on_bp_value_changed(r))
-            self.setCellWidget(row, 5, diastolic_spin)
-            
-            # 測量日期 (原本索引7改為6)
-            date_str = ""
-            if bp_info.get('date'):
-                try:
-                    date_tw = bp_info['date']
-                    if len(date_tw) >= 7:
-                        yy = int(date_tw[:3]) + 1911
-                        mm = date_tw[3:5]
-                        dd = date_tw[5:7]
-                        date_str = f"{yy}/{mm}/{dd}"
-                except:
-                    date_str = bp_info['date']
-            self.setItem(row, 6, QTableWidgetItem(date_str))
-            
-            # 狀態 (原本索引8改為7) - 初始設定
-            if has_bp_data:
-                status = "已選擇" if has_bp_data else "有資料"
-                status_item = QTableWidgetItem(status)
-                status_item.setBackground(QBrush(QColor(200, 255, 200)))  # 綠色
-            else:
-                status_item = QTableWidgetItem("待輸入")
-                status_item.setBackground(QBrush(QColor(240, 240, 240)))  # 灰色
-            self.setItem(row, 7, status_item)
-        
-        self._updating = False
-        
-        # 初始狀態已設定，無需再次更新
+            # 測量日期
+            date_tw = bp_info.get('date')
+            dates.append(format_tw_date(date_tw) if date_tw else "")
+        
+        # 一次交給模型，表格只繪製可見的列；
+        # 重新載入同一份名單（例如只改日期區間）時原地更新，不重設整個模型
+        if self._populated_pids == self.normalized_pids:
+            self.patient_model.update_rows(self.patient_data, checked, systolic_values, diastolic_values, dates)
+        else:
+            self.patient_model.reset_rows(self.patient_data, checked, systolic_values, diastolic_values, dates)
+            self._populated_pids = self.normalized_pids
 
         if auto_selected > 0:
             logger.info(f"自動選擇了 {auto_selected} 位有血壓資料的病患")
@@ -607,128 +1317,64 @@ class UltraPatientTableWidget(QTableWidget):
         
         self.selection_changed.emit()
     
-    def on_checkbox_changed(self, row: int, state: int) -> None:
-        """選擇框變更 - 同時更新狀態欄位"""
-        if self._updating or row >= len(self.patient_data):
+    def on_checkbox_changed(self, row: int, checked: bool) -> None:
+        """選擇框變更 - 狀態欄位由模型連動更新"""
+        if row >= len(self.patient_data):
             return
             
-        patient_id = self.patient_data[row]['pat_pid']
         # 使用統一格式防止重複
-        normalized_pid = normalize_patient_id(patient_id)
-        if state == Qt.CheckState.Checked.value:
+        normalized_pid = self.normalized_pids[row]
+        if checked:
             self.selected_patients.add(normalized_pid)
         else:
             self.selected_patients.discard(normalized_pid)
         
-        # 更新狀態欄位連動
-        self.update_row_status(row)
         self.selection_changed.emit()
     
     def on_bp_value_changed(self, row: int) -> None:
         """血壓值變更時的處理 - 修正自動選擇邏輯"""
-        if self._updating or row >= len(self.patient_data):
+        if row >= len(self.patient_data):
             return
         
         # 取得目前的血壓值
-        systolic_spin = self.cellWidget(row, 4)
-        diastolic_spin = self.cellWidget(row, 5)
+        systolic, diastolic = self.patient_model.bp_values(row)
+        
+        # 只有當兩個數值都有填入時才自動勾選
+        if systolic > 0 and diastolic > 0 and not self.patient_model.is_checked(row):
+            self.patient_model.set_checked(row, True, notify=False)
+            self.selected_patients.add(self.normalized_pids[row])
         
-        if systolic_spin and diastolic_spin:
-            systolic = systolic_spin.value()
-            diastolic = diastolic_spin.value()
-            
-            # 只有當兩個數值都有填入時才自動勾選
-            if systolic > 0 and diastolic > 0:
-                checkbox = self.cellWidget(row, 0)
-                if checkbox and not checkbox.isChecked():
-                    self._updating = True
-                    checkbox.setChecked(True)
-                    patient_id = self.patient_data[row]['pat_pid']
-                    normalized_pid = normalize_patient_id(patient_id)
-                    self.selected_patients.add(normalized_pid)
-                    self._updating = False
-        
-        # 更新狀態顯示
-        self.update_row_status(row)
         self.data_changed.emit()
         self.selection_changed.emit()
     
-    def update_row_status(self, row: int) -> None:
-        """更新單一列的狀態顯示"""
-        if row >= len(self.patient_data):
-            return
-        
-        # 檢查是否被選擇
-        checkbox = self.cellWidget(row, 0)
-        is_selected = checkbox.isChecked() if checkbox else False
-        
-        # 檢查是否有血壓值
-        systolic_spin = self.cellWidget(row, 4)
-        diastolic_spin = self.cellWidget(row, 5)
-        has_bp_values = False
-        
-        if systolic_spin and diastolic_spin:
-            systolic = systolic_spin.value()
-            diastolic = diastolic_spin.value()
-            has_bp_values = systolic > 0 or diastolic > 0
-        
-        # 更新狀態文字和顏色
-        status_item = self.item(row, 7)
-        if status_item:
-            if is_selected:
-                if has_bp_values:
-                    status_item.setText("已選擇")
-                    status_item.setBackground(QBrush(QColor(200, 255, 200)))  # 綠色
-                else:
-                    status_item.setText("已選擇")
-                    status_item.setBackground(QBrush(QColor(200, 200, 255)))  # 藍色
-            else:
-                if has_bp_values:
-                    status_item.setText("有資料")
-                    status_item.setBackground(QBrush(QColor(255, 255, 200)))  # 黃色
-                else:
-                    status_item.setText("待輸入")
-                    status_item.setBackground(QBrush(QColor(240, 240, 240)))  # 灰色
-    
     def get_export_data(self) -> List[Dict]:
         """取得匯出資料 - 完全基於GUI表單中的勾選狀態"""
         export_data = []
+        row_count = self.patient_model.rowCount()
+        # 逐列的除錯訊息只在DEBUG層級開啟時才組字串
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
 
-        logger.debug(f"開始檢查匯出資料，表格總行數: {self.rowCount()}")
+        logger.debug(f"開始檢查匯出資料，表格總行數: {row_count}")
         
-        # 遍歷表格中每一行，檢查勾選狀態
-        for row in range(self.rowCount()):
-            # 第一步：檢查是否勾選
-            checkbox = self.cellWidget(row, 0)
-            if not (checkbox and checkbox.isChecked()):
-                continue  # 跳過未勾選的行
-            
+        # 第一步：只處理勾選的列（依表格順序），未勾選的列完全不進入迴圈
+        for row in self.patient_model.checked_rows():
             # 第二步：取得病患基本資料
             if row >= len(self.patient_data):
                 logger.warning(f"第{row}行超出病患資料範圍")
                 continue
                 
-            patient = self.patient_data[row].copy()
-            patient_id = normalize_patient_id(patient['pat_pid'])
-            
-            # 第三步：從GUI取得當前血壓值（以GUI顯示為準）
-            systolic_spin = self.cellWidget(row, 4)
-            diastolic_spin = self.cellWidget(row, 5)
-            
-            if not (systolic_spin and diastolic_spin):
-                logger.warning(f"第{row}行血壓輸入框不存在")
-                continue
+            patient = self.patient_data[row].to_dict()
+            patient_id = self.normalized_pids[row]
             
-            # 取得GUI中的血壓值
-            systolic = systolic_spin.value()
-            diastolic = diastolic_spin.value()
+            # 第三步：從表格取得當前血壓值（以GUI顯示為準）
+            systolic, diastolic = self.patient_model.bp_values(row)
             
             # 第四步：驗證血壓數值範圍並只匯出有完整資料的病患
-            if not (BloodPressureRange.SYSTOLIC_MIN <= systolic <= BloodPressureRange.SYSTOLIC_MAX and
-                    BloodPressureRange.DIASTOLIC_MIN <= diastolic <= BloodPressureRange.DIASTOLIC_MAX):
+            if not is_valid_blood_pressure(systolic, diastolic):
                 logger.warning(f"跳過第{row}行：血壓值超出合理範圍 (收縮壓:{systolic}, 舒張壓:{diastolic})")
-                logger.debug(f"  合理範圍: 收縮壓 {BloodPressureRange.SYSTOLIC_MIN}-{BloodPressureRange.SYSTOLIC_MAX} {HealthInsuranceCode.BP_UNIT}, "
-                      f"舒張壓 {BloodPressureRange.DIASTOLIC_MIN}-{BloodPressureRange.DIASTOLIC_MAX} {HealthInsuranceCode.BP_UNIT}")
+                if debug_enabled:
+                    logger.debug(f"  合理範圍: 收縮壓 {BloodPressureRange.SYSTOLIC_MIN}-{BloodPressureRange.SYSTOLIC_MAX} {HealthInsuranceCode.BP_UNIT}, "
+                          f"舒張壓 {BloodPressureRange.DIASTOLIC_MIN}-{BloodPressureRange.DIASTOLIC_MAX} {HealthInsuranceCode.BP_UNIT}")
                 continue
                 
             # 第五步：設定血壓值和時間資訊
@@ -747,40 +1393,28 @@ class UltraPatientTableWidget(QTableWidget):
                 patient['hdate'] = f"{tw_year:03d}{current_date.month:02d}{current_date.day:02d}"
                 patient['htime'] = f"{current_date.hour:02d}{current_date.minute:02d}{current_date.second:02d}"
             
-            # 向下兼容的日期時間格式
-            patient['bp_date'] = patient.get('hdate', datetime.now().strftime("%Y%m%d")[2:])
-            patient['bp_time'] = patient.get('htime', datetime.now().strftime("%H%M%S"))
+            # 向下兼容的日期時間格式（hdate/htime在上面一定已設定）
+            patient['bp_date'] = patient['hdate']
+            patient['bp_time'] = patient['htime']
             
             # 加入匯出清單
             export_data.append(patient)
-            logger.debug(f"第{row}行已加入匯出：{patient_id} (收縮壓:{systolic}, 舒張壓:{diastolic})")
+            if debug_enabled:
+                logger.debug(f"第{row}行已加入匯出：{patient_id} (收縮壓:{systolic}, 舒張壓:{diastolic})")
 
         logger.info(f"匯出資料準備完成，共{len(export_data)}筆")
         return export_data
     
     def select_all(self) -> None:
         """全選"""
-        self._updating = True
-        for row in range(self.rowCount()):
-            checkbox = self.cellWidget(row, 0)
-            if checkbox:
-                checkbox.setChecked(True)
-                if row < len(self.patient_data):
-                    patient_id = self.patient_data[row]['pat_pid']
-                    normalized_pid = normalize_patient_id(patient_id)
-                    self.selected_patients.add(normalized_pid)
-        self._updating = False
+        self.patient_model.set_all_checked(True)
+        self.selected_patients.update(self.patient_index)
         self.selection_changed.emit()
     
     def clear_selection(self) -> None:
         """清除選擇"""
-        self._updating = True
-        for row in range(self.rowCount()):
-            checkbox = self.cellWidget(row, 0)
-            if checkbox:
-                checkbox.setChecked(False)
+        self.patient_model.set_all_checked(False)
         self.selected_patients.clear()
-        self._updating = False
         self.selection_changed.emit()
 
 
@@ -801,12 +1435,65 @@ class UltraLoadingThread(QThread):
         self.loader.load()
 
 
+class VishfamLoadingThread(QThread):
+    """病患名單載入執行緒"""
+    loaded = Signal(list)
+    error_occurred = Signal(str)
+
+    def __init__(self, vishfam_path: str):
+        super().__init__()
+        self.vishfam_path = vishfam_path
+    
+    def run(self) -> None:
+        try:
+            self.loaded.emit(read_vishfam(self.vishfam_path))
+        except Exception as e:
+            self.error_occurred.emit(str(e))
+
+
+class XmlExportThread(QThread):
+    """XML/ZIP匯出執行緒 - CO01M/co03l查詢表讀取、Big5編碼與寫檔都不佔用介面執行緒"""
+    progress = Signal(int, int)
+    exported = Signal()
+    error_occurred = Signal(str)
+
+    def __init__(self, writer: Callable[..., None], filename: str, data: List[Dict], hospital_code: str,
+                 load_lookups: Callable[[], Tuple[Dict[str, str], Dict[Tuple[str, str], str]]]):
+        super().__init__()
+        self.writer = writer
+        self.filename = filename
+        self.data = data
+        self.hospital_code = hospital_code
+        self.load_lookups = load_lookups
+    
+    def run(self) -> None:
+        try:
+            co01m_data, co03l_data = self.load_lookups()
+            self.writer(self.filename, self.data, self.hospital_code, co01m_data, co03l_data,
+                        progress=self.progress.emit)
+            self.exported.emit()
+        except Exception as e:
+            self.error_occurred.emit(str(e))
+
+
 class UltraMainWindow(QMainWindow):
     """主視窗"""
     
+    BP_CACHE_SIZE = 8  # 保留最近幾次血壓載入結果
+    ZIP_COMPRESS_LEVEL = 6  # XML重複性高，6與9壓縮率相差無幾但速度快得多
+    SEARCH_DEBOUNCE_MS = 100  # 停止輸入多久後才執行搜尋篩選
+    EXPORT_PROGRESS_EVERY = 500  # 匯出時每寫入幾位病患回報一次進度
+    
     def __init__(self):
         super().__init__()
         self.loading_thread = None
+        self.vishfam_thread = None
+        self.export_thread = None
+        self.co01m_path = ""  # 匯出用CO01M.DBF路徑 (載入資料夾時設定)
+        self.co03l_path = ""  # 匯出用co03l.dbf路徑 (載入資料夾時設定)
+        self._bp_cache: Dict[tuple, bytes] = {}  # 血壓載入結果快取 (marshal序列化)
+        self._bp_cache_key: Optional[tuple] = None  # 載入中結果對應的快取鍵
+        self._lookup_cache: Optional[Tuple[tuple, Dict[str, str], Dict[Tuple[str, str], str]]] = None  # CO01M/co03l查詢表快取
         self.setup_ui()
         
     def setup_ui(self) -> None:
@@ -928,7 +1615,12 @@ class UltraMainWindow(QMainWindow):
         search_layout.addWidget(QLabel("搜尋:"))
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("輸入病歷號或姓名...")
-        self.search_input.textChanged.connect(self.filter_table)
+        # 連續輸入時只在停頓後篩選一次，避免每個字元都掃過整個表格
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(self.SEARCH_DEBOUNCE_MS)
+        self.filter_timer.timeout.connect(lambda: self.filter_table(self.search_input.text()))
+        self.search_input.textChanged.connect(lambda _text: self.filter_timer.start())
         search_layout.addWidget(self.search_input)
         
         search_layout.addStretch()
@@ -941,8 +1633,13 @@ class UltraMainWindow(QMainWindow):
         
         # 表格
         self.table = UltraPatientTableWidget()
-        self.table.data_changed.connect(self.update_stats)
-        self.table.selection_changed.connect(self.update_stats)
+        # 同一輪事件中多次變動只重算一次統計
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setSingleShot(True)
+        self.stats_timer.setInterval(0)
+        self.stats_timer.timeout.connect(self.update_stats)
+        self.table.data_changed.connect(self.schedule_stats_update)
+        self.table.selection_changed.connect(self.schedule_stats_update)
         layout.addWidget(self.table)
         
         # 狀態欄
@@ -990,18 +1687,37 @@ class UltraMainWindow(QMainWindow):
     
     def load_data(self, folder: str) -> None:
         """載入資料"""
+        vishfam_path = Path(folder) / "VISHFAM.DBF"
+        
+        if not vishfam_path.exists():
+            QMessageBox.critical(self, "錯誤", "找不到VISHFAM.DBF檔案")
+            return
+        
+        # 於背景執行緒載入VISHFAM，完成後接續 on_vishfam_loaded
+        self.status_bar.showMessage("正在載入病患名單...")
+        self.select_folder_btn.setEnabled(False)
+        
+        self.vishfam_thread = VishfamLoadingThread(str(vishfam_path))
+        self.vishfam_thread.loaded.connect(self.on_vishfam_loaded)
+        self.vishfam_thread.error_occurred.connect(self.on_vishfam_error)
+        self.vishfam_thread.start()
+    
+    def on_vishfam_error(self, error_msg: str) -> None:
+        """病患名單載入發生錯誤"""
+        self.select_folder_btn.setEnabled(True)
+        self.status_bar.showMessage("載入失敗")
+        QMessageBox.critical(self, "載入錯誤", f"載入資料時發生錯誤:\n{error_msg}")
+    
+    def on_vishfam_loaded(self, patients: List[PatientRecord]) -> None:
+        """病患名單載入完成，接續載入血壓資料"""
+        self.select_folder_btn.setEnabled(True)
         try:
-            folder_path = Path(folder)
-            vishfam_path = folder_path / "VISHFAM.DBF"
-            co18h_path = folder_path / "CO18H.DBF"
-            
-            if not vishfam_path.exists():
-                QMessageBox.critical(self, "錯誤", "找不到VISHFAM.DBF檔案")
-                return
-            
-            # 載入VISHFAM
-            self.status_bar.showMessage("正在載入病患名單...")
-            patient_ids = self.table.load_vishfam(str(vishfam_path))
+            vishfam_path = Path(self.vishfam_thread.vishfam_path)
+            co18h_path = vishfam_path.with_name("CO18H.DBF")
+            # 匯出用的DBF路徑在載入時決定一次
+            self.co01m_path = str(vishfam_path.with_name("CO01M.DBF"))
+            self.co03l_path = str(vishfam_path.with_name("co03l.dbf"))
+            patient_ids = self.table.set_patient_data(patients)
             
             if not patient_ids:
                 QMessageBox.warning(self, "警告", "沒有找到有效的病患資料")
@@ -1053,6 +1769,18 @@ class UltraMainWindow(QMainWindow):
         self.progress_bar.setVisible(True)
         self.select_folder_btn.setEnabled(False)
         
+        # 相同檔案、相同區間、相同病患名單時直接使用快取結果，不重新掃描CO18H
+        stat = os.stat(co18h_path)
+        cache_key = (co18h_path, stat.st_mtime_ns, stat.st_size, years_limit, start_date, end_date,
+                     date.today(), frozenset(patient_ids))
+        cached = self._bp_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"使用快取的血壓資料 ({range_text})")
+            self._bp_cache_key = None
+            self.on_loading_finished(marshal.loads(cached))
+            return
+        self._bp_cache_key = cache_key
+        
         self.loading_thread = UltraLoadingThread(co18h_path, patient_ids, years_limit, start_date, end_date)
         self.loading_thread.progress.connect(self.on_loading_progress)
         self.loading_thread.finished.connect(self.on_loading_finished)
@@ -1067,6 +1795,7 @@ class UltraMainWindow(QMainWindow):
     
     def on_loading_error(self, error_msg: str):
         """載入發生錯誤"""
+        self._bp_cache_key = None
         self.progress_bar.setVisible(False)
         self.select_folder_btn.setEnabled(True)
         self.status_bar.showMessage("載入失敗")
@@ -1086,6 +1815,13 @@ class UltraMainWindow(QMainWindow):
         if bp_data is None:
             return  # 錯誤已由 on_loading_error 處理
 
+        # 保存本次掃描結果，超過上限時移除最舊的一筆
+        if self._bp_cache_key is not None:
+            self._bp_cache[self._bp_cache_key] = marshal.dumps(bp_data)
+            self._bp_cache_key = None
+            if len(self._bp_cache) > self.BP_CACHE_SIZE:
+                del self._bp_cache[next(iter(self._bp_cache))]
+
         self.table.update_blood_pressure_data(bp_data)
         
         # 統計
@@ -1119,23 +1855,32 @@ class UltraMainWindow(QMainWindow):
     def select_all(self) -> None:
         """全選"""
         self.table.select_all()
-        self.update_stats()
     
     def clear_selection(self) -> None:
         """清除選擇"""
         self.table.clear_selection()
-        self.update_stats()
     
     def filter_table(self, text: str) -> None:
         """篩選表格"""
-        for row in range(self.table.rowCount()):
-            show = True
-            if text:
-                pid = self.table.item(row, 1).text() if self.table.item(row, 1) else ""
-                name = self.table.item(row, 2).text() if self.table.item(row, 2) else ""
-                if text.lower() not in pid.lower() and text.lower() not in name.lower():
-                    show = False
-            self.table.setRowHidden(row, not show)
+        table = self.table
+        text = text.lower()
+        # 模型已一次重設填表；篩選時逐列setRowHidden會各自觸發版面更新，
+        # 因此暫停重繪並只改變顯示狀態有變的列，結束後統一重繪一次
+        is_hidden = table.isRowHidden
+        set_hidden = table.setRowHidden
+        table.setUpdatesEnabled(False)
+        try:
+            for row, (pid, name) in enumerate(table.search_index):
+                hidden = bool(text) and text not in pid and text not in name
+                if is_hidden(row) != hidden:
+                    set_hidden(row, hidden)
+        finally:
+            table.setUpdatesEnabled(True)
+    
+    def schedule_stats_update(self) -> None:
+        """排定於回到事件迴圈時更新統計，合併連續觸發的訊號"""
+        if not self.stats_timer.isActive():
+            self.stats_timer.start()
     
     def update_stats(self) -> None:
         """更新統計 - 修正總數統計"""
@@ -1143,44 +1888,27 @@ class UltraMainWindow(QMainWindow):
             return
         
         # 直接計算VISHFAM資料中有效的病患數量
-        if hasattr(self.table, 'patient_data') and self.table.patient_data:
-            # 去重計算，使用集合去重
-            unique_patients = set()
-            for patient in self.table.patient_data:
-                if patient.get('pat_pid'):
-                    unique_patients.add(normalize_patient_id(patient['pat_pid']))
-            total = len(unique_patients)
-        else:
-            total = 0
-        
-        # 重新計算實際勾選數量
-        actual_selected = 0
-        self.table.selected_patients.clear()
-        
-        for row in range(min(total, self.table.rowCount())):
-            checkbox = self.table.cellWidget(row, 0)
-            if checkbox and checkbox.isChecked():
-                actual_selected += 1
-                if row < len(self.table.patient_data):
-                    patient_id = self.table.patient_data[row]['pat_pid']
-                    normalized_pid = normalize_patient_id(patient_id)
-                    self.table.selected_patients.add(normalized_pid)
+        # 去重後的病患數即為索引大小
+        total = len(self.table.patient_index)
         
+        # 勾選集合由表格在每次勾選變動時同步維護，不必逐列重新掃描
         selected = len(self.table.selected_patients)
         
         # 簡化統計顯示，只顯示總計和已選擇
         self.stats_label.setText(f"總計: {total} 筆 | 已選: {selected} 筆")
         
         # 調試資訊
-        logger.debug(f"統計調試: 病患資料長度={len(self.table.patient_data) if self.table.patient_data else 0}, 表格行數={self.table.rowCount()}, 實際勾選={actual_selected}, 集合大小={selected}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"統計調試: 病患資料長度={len(self.table.patient_data) if self.table.patient_data else 0}, 表格行數={self.table.patient_model.rowCount()}, 集合大小={selected}")
     
     def export_data(self) -> None:
         """匯出資料"""
         export_data = self.table.get_export_data()
 
-        logger.debug(f"匯出調試: 準備匯出 {len(export_data)} 筆資料")
-        for i, patient in enumerate(export_data[:5]):  # 顯示前5筆
-            logger.debug(f"  {i+1}: {patient['pat_pid']} - 收縮壓:{patient.get('systolic', 0)}, 舒張壓:{patient.get('diastolic', 0)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"匯出調試: 準備匯出 {len(export_data)} 筆資料")
+            for i, patient in enumerate(export_data[:5]):  # 顯示前5筆
+                logger.debug(f"  {i+1}: {patient['pat_pid']} - 收縮壓:{patient.get('systolic', 0)}, 舒張壓:{patient.get('diastolic', 0)}")
         
         if not export_data:
             QMessageBox.warning(self, "警告", "請選擇至少一筆有血壓值的資料!")
@@ -1232,36 +1960,85 @@ class UltraMainWindow(QMainWindow):
         if not filename:
             return
         
+        # 醫事機構代碼在介面執行緒驗證，錯誤可立即提示；查詢表交由匯出執行緒讀取
         try:
-            if export_as_zip:
-                self.write_xml_and_zip(export_data, filename)
-            else:
-                self.write_xml(export_data, filename)
-            
-            # 統計實際匯出的病患數（每個病患一筆資料，包含收縮壓和舒張壓）
-            valid_exports = sum(1 for p in export_data if p.get('systolic', 0) > 0 and p.get('diastolic', 0) > 0)
-            
-            file_type = "ZIP 壓縮檔案" if export_as_zip else "XML檔案"
-            QMessageBox.information(
-                self,
-                "匯出成功",
-                f"✅ 匯出成功!\n"
-                f"📁 檔案: {Path(filename).name}\n"
-                f"📦 格式: {file_type}\n"
-                f"📊 匯出: {valid_exports} 位病患血壓資料\n"
-                f"📋 規範: 健保署XML格式\n"
-                f"🔍 每位病患包含收縮壓與舒張壓記錄"
-            )
-            self.status_bar.showMessage(f"匯出完成 - {valid_exports} 位病患資料 ({file_type})")
-            
+            hospital_code = self._validate_hospital_code()
         except Exception as e:
             QMessageBox.critical(self, "匯出錯誤", f"匯出失敗:\n{str(e)}")
-    
-    def write_xml(self, data: List[Dict], filename: str) -> None:
-        """寫入XML - 符合健保署最新规范"""
-        from datetime import datetime, timedelta
-        import os
+            return
+        
+        # 統計實際匯出的病患數（每個病患一筆資料，包含收縮壓和舒張壓）
+        valid_exports = sum(1 for p in export_data if p.get('systolic', 0) > 0 and p.get('diastolic', 0) > 0)
+        file_type = "ZIP 壓縮檔案" if export_as_zip else "XML檔案"
+        writer = self._write_zip_file if export_as_zip else self._write_xml_file
+        
+        self.status_bar.showMessage(f"匯出中 - {file_type}...")
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.export_btn.setEnabled(False)
         
+        load_lookups = partial(self._load_export_lookups, self.co01m_path, self.co03l_path)
+        self.export_thread = XmlExportThread(writer, filename, export_data, hospital_code, load_lookups)
+        self.export_thread.progress.connect(self.on_export_progress)
+        self.export_thread.exported.connect(
+            lambda: self.on_export_finished(filename, file_type, valid_exports))
+        self.export_thread.error_occurred.connect(self.on_export_error)
+        self.export_thread.start()
+    
+    def on_export_progress(self, current: int, total: int) -> None:
+        """更新匯出進度"""
+        percent = int(current * 100 / total) if total > 0 else 0
+        self.progress_bar.setValue(percent)
+        self.status_bar.showMessage(f"匯出中... {current}/{total} ({percent}%)")
+    
+    def on_export_finished(self, filename: str, file_type: str, valid_exports: int) -> None:
+        """匯出完成"""
+        self.progress_bar.setVisible(False)
+        self.export_btn.setEnabled(True)
+        QMessageBox.information(
+            self,
+            "匯出成功",
+            f"✅ 匯出成功!\n"
+            f"📁 檔案: {Path(filename).name}\n"
+            f"📦 格式: {file_type}\n"
+            f"📊 匯出: {valid_exports} 位病患血壓資料\n"
+            f"📋 規範: 健保署XML格式\n"
+            f"🔍 每位病患包含收縮壓與舒張壓記錄"
+        )
+        self.status_bar.showMessage(f"匯出完成 - {valid_exports} 位病患資料 ({file_type})")
+    
+    def on_export_error(self, error_msg: str) -> None:
+        """匯出發生錯誤"""
+        self.progress_bar.setVisible(False)
+        self.export_btn.setEnabled(True)
+        self.status_bar.showMessage("匯出失敗")
+        QMessageBox.critical(self, "匯出錯誤", f"匯出失敗:\n{error_msg}")
+    
+    def _write_xml_file(self, filename: str, data: List[Dict], hospital_code: str,
+                        co01m_data: Dict[str, str], co03l_data: Dict[Tuple[str, str], str],
+                        progress: Optional[Callable[[int, int], None]] = None) -> None:
+        """將XML寫入指定檔案 (不存取介面元件，可於匯出執行緒呼叫)"""
+        self._check_big5_fields(data, co01m_data)
+        
+        # 直接寫入暫存檔 (Big5編碼，嚴格模式)，全部成功才換成正式檔名，失敗時不會產生檔案
+        temp_filename = f"{filename}.tmp"
+        try:
+            with open(temp_filename, 'w', encoding='big5') as xml_file:
+                self._write_xml_stream(xml_file, data, hospital_code, co01m_data, co03l_data, progress)
+        except BaseException:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            raise
+
+        os.replace(temp_filename, filename)
+    
+    def _validate_hospital_code(self) -> str:
+        """
+        取得並驗證醫事機構代碼
+
+        Returns:
+            10碼數字的醫事機構代碼
+        """
         # 取得並驗證醫事機構代碼
         hospital_code = self.hospital_code_input.text().strip()
 
@@ -1284,258 +2061,258 @@ class UltraMainWindow(QMainWindow):
                 f"範例: 3522013684"
             )
         
-        # 嘗試載入額外的DBF資料
-        folder_path = self.table.dbf_folder
+        return hospital_code
+    
+    def _write_xml_stream(self, xml_file: TextIO, data: List[Dict], hospital_code: str,
+                          co01m_data: Dict[str, str], co03l_data: Dict[Tuple[str, str], str],
+                          progress: Optional[Callable[[int, int], None]] = None) -> None:
+        """
+        逐位病患產生<hdata>區塊並直接寫入已開啟的Big5文字串流，不在記憶體保留整份文件
+
+        遇到無法以Big5編碼的字元時會繼續檢查其餘病患，最後一次列出並拋出例外；
+        有提供progress時每EXPORT_PROGRESS_EVERY位病患回報一次 (已寫入數, 總數)
+        """
+        problematic_chars = set()
+        total = len(data)
+        progress_every = self.EXPORT_PROGRESS_EVERY
+        xml_file.write('<?xml version="1.0" encoding="Big5"?>\n<patient>\n')
+        for count, block in enumerate(self._iter_hdata_blocks(data, hospital_code, co01m_data, co03l_data), 1):
+            if progress is not None and count % progress_every == 0:
+                progress(count, total)
+            try:
+                xml_file.write(block)
+            except UnicodeEncodeError:
+                # 找出無法編碼的字元，繼續檢查其餘病患以一次列出
+                for char in block:
+                    try:
+                        char.encode('big5')
+                    except UnicodeEncodeError:
+                        problematic_chars.add(char)
+                continue
+            xml_file.write('\n')
+        xml_file.write('</patient>')
+        if progress is not None:
+            progress(total, total)
+
+        if problematic_chars:
+            raise Exception(self._big5_error_message(problematic_chars))
+    
+    @staticmethod
+    def _big5_error_message(problematic_chars: set) -> str:
+        """無法以Big5編碼時給使用者的錯誤訊息"""
+        return (
+            f"部分中文字無法轉為Big5編碼\n\n"
+            f"無法編碼的字元: {''.join(sorted(problematic_chars))}\n\n"
+            f"建議:\n"
+            f"1. 請檢查病患姓名是否包含特殊字（如：堃、煊、栢）\n"
+            f"2. 可手動修改資料後重新匯出\n"
+            f"3. 或聯絡系統管理員"
+        )
+    
+    def _check_big5_fields(self, data: List[Dict], co01m_data: Dict[str, str]) -> None:
+        """
+        寫檔前先檢查會輸出到XML的病患欄位是否都能以Big5編碼
+
+        只比對各欄位的不重複值，有問題時在產生任何檔案之前就拋出例外；
+        其他欄位若仍有無法編碼的字元，寫入時的逐段檢查也會攔下
+        """
+        values = []
+        for patient in data:
+            values.append(patient.get('pat_id') or '')
+            values.append(patient.get('hdate') or '')
+            values.append(patient.get('htime') or '')
+            values.append(co01m_data.get(patient.get('pat_pid'), ''))
+        problematic_chars = find_non_big5_chars(values)
+        if problematic_chars:
+            raise Exception(self._big5_error_message(problematic_chars))
+    
+    def _load_export_lookups(self, co01m_path: str, co03l_path: str) -> Tuple[Dict[str, str], Dict[Tuple[str, str], str]]:
+        """
+        讀取匯出用的CO01M出生日期與co03l就醫序號查詢表 (於匯出執行緒呼叫)
+
+        以兩個檔案的修改時間與大小作為快取鍵，檔案未變動時直接沿用上次結果，
+        連續匯出XML與ZIP時不必重複讀檔；檔案不存在時對應的查詢表為空
+
+        Returns:
+            (CO01M出生日期對照, co03l就醫序號對照)
+        """
+        cache_key: tuple = (co01m_path, co03l_path)
+        exists = []
+        for path in (co01m_path, co03l_path):
+            try:
+                stat = os.stat(path)
+                cache_key += (stat.st_mtime_ns, stat.st_size)
+                exists.append(True)
+            except OSError:
+                cache_key += (None, None)
+                exists.append(False)
+        
+        if self._lookup_cache is not None and self._lookup_cache[0] == cache_key:
+            logger.debug("CO01M/co03l未變動，沿用快取的查詢表")
+            return self._lookup_cache[1], self._lookup_cache[2]
+        
         co01m_data = {}
         co03l_data = {}
         
-        # 嘗試讀取CO01M.DBF的出生日期資料
-        co01m_path = os.path.join(folder_path, 'CO01M.DBF')
-        if os.path.exists(co01m_path):
-            try:
-                table = dbf.Table(co01m_path)
-                table.open()
-                
-                loaded_count = 0
-                
-                for record in table:
-                    try:
-                        # 直接使用欄位名稱訪問
-                        pid = str(record.KCSTMR).strip().zfill(7) if record.KCSTMR else ''
-                        birth_date = str(record.MBIRTHDT).strip() if record.MBIRTHDT else ''
-                        
-                        if pid and birth_date:
-                            co01m_data[pid] = birth_date
-                            loaded_count += 1
-                            
-                    except Exception as e:
-                        continue
-                
-                table.close()
-                logger.info(f"CO01M載入: {loaded_count} 筆出生日期")
-            except Exception as e:
-                logger.warning(f"CO01M讀取失敗: {e}")
+        # 兩個檔案互不相關，同時讀取
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            co01m_future = executor.submit(read_co01m_birth_dates, co01m_path) if exists[0] else None
+            co03l_future = executor.submit(read_co03l_visit_dates, co03l_path) if exists[1] else None
+            
+            # 嘗試讀取CO01M.DBF的出生日期資料
+            if co01m_future is not None:
+                try:
+                    co01m_data = co01m_future.result()
+                    logger.info(f"CO01M載入: {len(co01m_data)} 筆出生日期")
+                except Exception as e:
+                    logger.warning(f"CO01M讀取失敗: {e}")
+            
+            # 嘗試讀取co03l.dbf的edate資料
+            if co03l_future is not None:
+                try:
+                    co03l_data = co03l_future.result()
+                except:
+                    pass
         
-        # 嘗試讀取co03l.dbf的edate資料
-        co03l_path = os.path.join(folder_path, 'co03l.dbf')
-        if os.path.exists(co03l_path):
-            try:
-                table = dbf.Table(co03l_path)
-                table.open()
-                for record in table:
-                    pid = str(record.KCSTMR).strip().zfill(7) if hasattr(record, 'KCSTMR') else ''
-                    edate = str(record.EDATE).strip() if hasattr(record, 'EDATE') else ''
-                    if pid and edate:
-                        # 建立key為 pid+date 的索引
-                        key = f"{pid}_{str(record.HDATE).strip() if hasattr(record, 'HDATE') else ''}"
-                        co03l_data[key] = edate
-                table.close()
-            except:
-                pass
-        
-        # 生成符合健保署規範的XML內容
-        xml_lines = []
-        xml_lines.append('<?xml version="1.0" encoding="Big5"?>')
-        xml_lines.append('<patient>')
-        
-        # 獲取當前時間的秒數，用於統一所有r10標籤的秒數部分（避免重複上傳失敗）
-        unified_second = datetime.now().second
+        self._lookup_cache = (cache_key, co01m_data, co03l_data)
+        return co01m_data, co03l_data
+    
+    def _iter_hdata_blocks(self, data: List[Dict], hospital_code: str,
+                           co01m_data: Dict[str, str], co03l_data: Dict[Tuple[str, str], str]) -> Iterator[str]:
+        """逐位病患產生<hdata>區塊（不含結尾換行）"""
+        # 整批匯出共用同一個時間點：秒數用於統一所有r10標籤（避免重複上傳失敗），
+        # 其餘欄位供h4/h5預設值與h16使用
+        export_time = datetime.now()
+        unified_second = export_time.second
+        tw_year = export_time.year - 1911
+        now_h4_value = f"{tw_year:03d}{export_time.month:02d}"
+        now_timestamp = f"{now_h4_value}{export_time.day:02d}{export_time.hour:02d}{export_time.minute:02d}{export_time.second:02d}"
 
         logger.info(f"準備匯出 {len(data)} 位病患，CO01M資料: {len(co01m_data)} 筆")
         logger.debug(f"統一秒數設定: {unified_second:02d} (避免重複上傳)")
         h10_count = 0
         
+        # 醫事機構代碼與h16在整批匯出中固定：r9行只需組一次，樣板也先代入這兩欄，
+        # 迴圈內只剩逐位病患的欄位 (兩者皆為純數字，不會含有樣板的大括號)
+        r9_line = f'      <r9>{hospital_code}</r9>'
+        hdata_template = (XML_HDATA_TEMPLATE
+                          .replace('{hospital_code}', hospital_code)
+                          .replace('{h16}', now_timestamp))
+        default_visit_seq = HealthInsuranceCode.DEFAULT_VISIT_SEQ
+        bp_item_code = HealthInsuranceCode.BP_ITEM_CODE
+        
         for patient in data:
-            xml_lines.append('  <hdata>')
-            
-            # h1: 報告類別
-            xml_lines.append(f'    <h1>{HealthInsuranceCode.REPORT_TYPE}</h1>')
-
-            # h2: 醫事機構代碼
-            xml_lines.append(f'    <h2>{hospital_code}</h2>')
-
-            # h3: 醫事類別
-            xml_lines.append(f'    <h3>{HealthInsuranceCode.MEDICAL_CATEGORY}</h3>')
+            pat_pid = patient.get('pat_pid')
+            hdate = patient.get('hdate')
+            htime = patient.get('htime')
             
             # h4: 血壓測量數值的年月 (從hdate取得)
-            if patient.get('hdate') and len(patient['hdate']) >= 5:
+            if hdate and len(hdate) >= 5:
                 # hdate格式為民國年YYYMMDD，取前5碼(YYYMM)
-                h4_value = patient['hdate'][:5]
+                h4_value = hdate[:5]
             else:
                 # 使用當前日期
-                current_date = datetime.now()
-                tw_year = current_date.year - 1911
-                h4_value = f"{tw_year:03d}{current_date.month:02d}"
-            xml_lines.append(f'    <h4>{h4_value}</h4>')
+                h4_value = now_h4_value
             
             # h5: 健保卡過卡日期時間 (使用hdate + htime)
-            if patient.get('hdate') and patient.get('htime'):
-                h5_value = patient['hdate'] + patient['htime']
+            if hdate and htime:
+                h5_value = hdate + htime
             else:
                 # 使用當前時間
-                current_datetime = datetime.now()
-                tw_year = current_datetime.year - 1911
-                h5_value = f"{tw_year:03d}{current_datetime.month:02d}{current_datetime.day:02d}{current_datetime.hour:02d}{current_datetime.minute:02d}{current_datetime.second:02d}"
-            xml_lines.append(f'    <h5>{h5_value}</h5>')
+                h5_value = now_timestamp
             
-            # h6: 就醫類別
-            xml_lines.append(f'    <h6>{HealthInsuranceCode.CASE_TYPE}</h6>')
-
             # h7: 就醫序號 (查詢co03l.dbf的edate欄位)
-            h7_value = HealthInsuranceCode.DEFAULT_VISIT_SEQ
-            if patient.get('pat_pid') and patient.get('hdate') and len(patient.get('hdate', '')) == 7:
-                key = f"{patient['pat_pid'].zfill(7)}_{patient['hdate']}"
-                if key in co03l_data:
-                    edate = co03l_data[key]
+            h7_value = default_visit_seq
+            if pat_pid and hdate and len(hdate) == 7:
+                edate = co03l_data.get((pat_pid, hdate))
+                if edate is not None:
                     # 去掉開頭的民國年(前3碼)，確保edate格式正確
                     if len(edate) >= 4:
                         h7_value = edate[3:].zfill(4)
                     if not h7_value or h7_value == '0000':
-                        h7_value = HealthInsuranceCode.DEFAULT_VISIT_SEQ
+                        h7_value = default_visit_seq
                 else:
-                    h7_value = HealthInsuranceCode.BP_ITEM_CODE  # 若無資料使用血壓檢驗項目代碼
-            xml_lines.append(f'    <h7>{h7_value}</h7>')
-
-            # h8: 補卡註記
-            xml_lines.append(f'    <h8>{HealthInsuranceCode.CARD_REPLACEMENT}</h8>')
+                    h7_value = bp_item_code  # 若無資料使用血壓檢驗項目代碼
+            
+            # h9~h12: 有資料才輸出
+            optional_tags = ''
             
             # h9: 身分證字號
             if patient.get('pat_id') and patient['pat_id'].strip():
-                xml_lines.append(f'    <h9>{patient["pat_id"]}</h9>')
+                optional_tags += f'\n    <h9>{xml_escape(patient["pat_id"])}</h9>'
             
             # h10: 出生日期 (從CO01M.DBF取得)
-            patient_pid = patient['pat_pid'].zfill(7)
-            birth_date = co01m_data.get(patient_pid, '')
+            birth_date = co01m_data.get(pat_pid, '')
             if birth_date:
-                xml_lines.append(f'    <h10>{birth_date}</h10>')
+                optional_tags += f'\n    <h10>{xml_escape(birth_date)}</h10>'
                 h10_count += 1
             
-            # h11: 就醫日期 (測量日期)
-            if patient.get('hdate'):
-                xml_lines.append(f'    <h11>{patient["hdate"]}</h11>')
-            
-            # h12: 同上
-            if patient.get('hdate'):
-                xml_lines.append(f'    <h12>{patient["hdate"]}</h12>')
-            
-            # h15: 診斷代碼
-            xml_lines.append(f'    <h15>{HealthInsuranceCode.DIAGNOSIS_CODE}</h15>')
-            
-            # h16: 現在的時間點
-            current_datetime = datetime.now()
-            tw_year = current_datetime.year - 1911
-            h16_value = f"{tw_year:03d}{current_datetime.month:02d}{current_datetime.day:02d}{current_datetime.hour:02d}{current_datetime.minute:02d}{current_datetime.second:02d}"
-            xml_lines.append(f'    <h16>{h16_value}</h16>')
+            # h11: 就醫日期 (測量日期)、h12: 同上
+            if hdate:
+                hdate_text = xml_escape(hdate)
+                optional_tags += f'\n    <h11>{hdate_text}</h11>\n    <h12>{hdate_text}</h12>'
             
             # h20: 檢查時間 (日期+時間)
-            if patient.get('hdate') and patient.get('htime'):
+            h20_tag = ''
+            r10_tag = ''
+            if hdate and htime:
                 # 只取時間部分的前4碼(時分)
-                time_part = patient['htime'][:4] if len(patient['htime']) >= 4 else patient['htime']
-                h20_value = patient['hdate'] + time_part
-                xml_lines.append(f'    <h20>{h20_value}</h20>')
-            
-            # h22: 檢驗項目名稱
-            xml_lines.append(f'    <h22>{HealthInsuranceCode.BP_TEST_NAME}</h22>')
-
-            # h26: 轉檢FLAG
-            xml_lines.append(f'    <h26>{HealthInsuranceCode.TRANSFER_FLAG}</h26>')
-            
-            # 報告資料段 - 收縮壓
-            if patient.get('systolic', 0) > 0:
-                xml_lines.append('    <rdata>')
-                xml_lines.append(f'      <r1>{HealthInsuranceCode.SYSTOLIC_SEQ}</r1>')
-                xml_lines.append(f'      <r2>{HealthInsuranceCode.SYSTOLIC_NAME}</r2>')
-                xml_lines.append(f'      <r3>{HealthInsuranceCode.BP_TEST_METHOD}</r3>')
-                xml_lines.append(f'      <r4>{patient["systolic"]}</r4>')
-                xml_lines.append(f'      <r5>{HealthInsuranceCode.BP_UNIT}</r5>')
-                xml_lines.append(f'      <r6-1>{HealthInsuranceCode.SYSTOLIC_REFERENCE}</r6-1>')
-                xml_lines.append(f'      <r9>{hospital_code}</r9>')
-                
-                # r10: 測量時間 (htime加一分鐘，秒數統一)
-                if patient.get('hdate') and patient.get('htime'):
-                    r10_value = calculate_r10_time(patient['hdate'], patient['htime'], unified_second)
-                    xml_lines.append(f'      <r10>{r10_value}</r10>')
+                time_part = htime[:4] if len(htime) >= 4 else htime
+                h20_tag = f'\n    <h20>{xml_escape(hdate + time_part)}</h20>'
                 
-                xml_lines.append('    </rdata>')
+                # r10: 測量時間 (htime加一分鐘，秒數統一)，收縮壓與舒張壓相同
+                r10_tag = f'\n      <r10>{xml_escape(calculate_r10_time(hdate, htime, unified_second))}</r10>'
             
-            # 報告資料段 - 舒張壓
+            # 報告資料段 - 收縮壓、舒張壓
+            rdata = ''
+            if patient.get('systolic', 0) > 0:
+                rdata += f"\n{build_bp_rdata_lines(True, patient['systolic'])}\n{r9_line}{r10_tag}\n    </rdata>"
             if patient.get('diastolic', 0) > 0:
-                xml_lines.append('    <rdata>')
-                xml_lines.append(f'      <r1>{HealthInsuranceCode.DIASTOLIC_SEQ}</r1>')
-                xml_lines.append(f'      <r2>{HealthInsuranceCode.DIASTOLIC_NAME}</r2>')
-                xml_lines.append(f'      <r3>{HealthInsuranceCode.BP_TEST_METHOD}</r3>')
-                xml_lines.append(f'      <r4>{patient["diastolic"]}</r4>')
-                xml_lines.append(f'      <r5>{HealthInsuranceCode.BP_UNIT}</r5>')
-                xml_lines.append(f'      <r6-1>{HealthInsuranceCode.DIASTOLIC_REFERENCE}</r6-1>')
-                xml_lines.append(f'      <r9>{hospital_code}</r9>')
-                
-                # r10: 測量時間 (htime加一分鐘，秒數統一)
-                if patient.get('hdate') and patient.get('htime'):
-                    r10_value = calculate_r10_time(patient['hdate'], patient['htime'], unified_second)
-                    xml_lines.append(f'      <r10>{r10_value}</r10>')
-                
-                xml_lines.append('    </rdata>')
+                rdata += f"\n{build_bp_rdata_lines(False, patient['diastolic'])}\n{r9_line}{r10_tag}\n    </rdata>"
             
-            xml_lines.append('  </hdata>')
+            # 病患與DBF來源的文字都要跳脫XML特殊字元 (&、<、>)，避免產生不合法的文件
+            yield hdata_template.format(
+                h4=xml_escape(h4_value),
+                h5=xml_escape(h5_value),
+                h7=xml_escape(h7_value),
+                h9_to_h12=optional_tags,
+                h20=h20_tag,
+                rdata=rdata,
+            )
         
-        xml_lines.append('</patient>')
-
         logger.info(f"XML生成完成，包含 {h10_count} 個h10標籤")
-
-        # 寫入檔案 (Big5編碼，嚴格模式)
-        xml_content = '\n'.join(xml_lines)
-
-        try:
-            # 先測試是否可以完整轉換為 Big5
-            xml_content.encode('big5')
-
-            # 確認可以轉換後才寫入檔案
-            with open(filename, 'w', encoding='big5') as f:
-                f.write(xml_content)
-
-        except UnicodeEncodeError as e:
-            # 找出無法編碼的字元
-            problematic_chars = set()
-            for char in xml_content:
-                try:
-                    char.encode('big5')
-                except UnicodeEncodeError:
-                    problematic_chars.add(char)
-
-            error_msg = (
-                f"部分中文字無法轉為Big5編碼\n\n"
-                f"無法編碼的字元: {''.join(sorted(problematic_chars))}\n\n"
-                f"建議:\n"
-                f"1. 請檢查病患姓名是否包含特殊字（如：堃、煊、栢）\n"
-                f"2. 可手動修改資料後重新匯出\n"
-                f"3. 或聯絡系統管理員"
-            )
-            raise Exception(error_msg)
     
-    def write_xml_and_zip(self, data: List[Dict], zip_filename: str) -> None:
-        """寫入XML並壓縮成ZIP檔案"""
-        import tempfile
-        import os
-        
-        # 建立暫存目錄
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # 產生XML檔案名稱（基於ZIP檔案名稱）
-            zip_name = Path(zip_filename).stem
-            xml_filename = os.path.join(temp_dir, f"{zip_name}.xml")
-            
-            # 寫入XML到暫存檔案
-            self.write_xml(data, xml_filename)
-            
-            # 建立ZIP檔案
-            with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as zipf:
-                # 將XML檔案加入ZIP
-                zipf.write(xml_filename, f"{zip_name}.xml")
-
-            logger.info(f"ZIP檔案建立完成: {zip_filename}")
-            logger.debug(f"壓縮內容: {zip_name}.xml")
+    def _write_zip_file(self, zip_filename: str, data: List[Dict], hospital_code: str,
+                        co01m_data: Dict[str, str], co03l_data: Dict[Tuple[str, str], str],
+                        progress: Optional[Callable[[int, int], None]] = None) -> None:
+        """將XML壓縮寫入指定ZIP檔案 (不存取介面元件，可於匯出執行緒呼叫)"""
+        self._check_big5_fields(data, co01m_data)
+        
+        # XML檔案名稱以ZIP檔案名稱為準；內容邊產生邊壓縮，不經過暫存XML檔
+        zip_name = Path(zip_filename).stem
+        temp_filename = f"{zip_filename}.tmp"
+        try:
+            with zipfile.ZipFile(temp_filename, 'w', zipfile.ZIP_DEFLATED,
+                                 compresslevel=self.ZIP_COMPRESS_LEVEL) as zipf:
+                with zipf.open(f"{zip_name}.xml", 'w') as raw_file, \
+                        io.TextIOWrapper(raw_file, encoding='big5') as xml_file:
+                    self._write_xml_stream(xml_file, data, hospital_code, co01m_data, co03l_data, progress)
+        except BaseException:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            raise
+
+        os.replace(temp_filename, zip_filename)
+        logger.info(f"ZIP檔案建立完成: {zip_filename}")
+        logger.debug(f"壓縮內容: {zip_name}.xml")
     
     def closeEvent(self, event: QCloseEvent) -> None:
         """關閉事件"""
+        if self.vishfam_thread and self.vishfam_thread.isRunning():
+            self.vishfam_thread.wait()
+        # 匯出寫到一半的暫存檔需由執行緒自行收尾，等待完成
+        if self.export_thread and self.export_thread.isRunning():
+            self.export_thread.wait()
         if self.loading_thread and self.loading_thread.isRunning():
             reply = QMessageBox.question(
                 self, 
@@ -1583,13 +2360,13 @@ def main() -> int:
         QPushButton:disabled {
             background-color: #94A3B8;
         }
-        QTableWidget {
+        QTableView {
             gridline-color: #E2E8F0;
             background-color: white;
             alternate-background-color: #F0FDF4;
             border-radius: 8px;
         }
-        QTableWidget::item {
+        QTableView::item {
             padding: 6px;
         }
         QHeaderView::section {
@@ -1610,22 +2387,19 @@ def main() -> int:
         QSpinBox:focus {
             border-color: #059669;
         }
-        QCheckBox {
-            spacing: 2px;
-        }
-        QCheckBox::indicator {
+        QTableView::indicator {
             width: 18px;
             height: 18px;
             border: 2px solid #E2E8F0;
             border-radius: 3px;
             background-color: white;
         }
-        QCheckBox::indicator:checked {
+        QTableView::indicator:checked {
             background-color: #059669;
             border-color: #059669;
             image: url(data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMTIiIGhlaWdodD0iOSIgdmlld0JveD0iMCAwIDEyIDkiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxwYXRoIGQ9Ik0xMSAwLjVMMy44IDcuN0wxIDQuOSIgc3Ryb2tlPSJ3aGl0ZSIgc3Ryb2tlLXdpZHRoPSIyIiBzdHJva2UtbGluZWNhcD0icm91bmQiIHN0cm9rZS1saW5lam9pbj0icm91bmQiLz4KPC9zdmc+);
         }
-        QCheckBox::indicator:hover {
+        QTableView::indicator:hover {
             border-color: #059669;
         }
         QProgressBar {
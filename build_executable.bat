@@ -21,7 +21,7 @@ call venv\Scripts\activate.bat
 
 REM 安裝依賴套件
 echo 安裝依賴套件...
-pip install dbf PySide6
+pip install PySide6
 if errorlevel 1 (
     echo 錯誤：安裝依賴套件失敗
     pause
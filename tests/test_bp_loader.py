@@ -0,0 +1,82 @@
+"""UltraBloodPressureLoader 掃描 CO18H.DBF 的回歸測試"""
+
+import struct
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PySide6.QtCore import QCoreApplication
+
+from bp2vpn_gui_ultra import DbfRawReader, UltraBloodPressureLoader
+
+CO18H_FIELDS = [('KCSTMR', 7), ('HDATE', 7), ('HTIME', 6), ('HITEM', 10), ('HVAL', 20)]
+
+
+def tw_date(value: date) -> bytes:
+    """西元日期轉民國年 YYYMMDD 位元組"""
+    return f"{value.year - 1911:03d}{value.month:02d}{value.day:02d}".encode('ascii')
+
+
+def write_co18h(path: Path, records: list) -> None:
+    """寫出只含 CO18H 必要欄位的最小 DBF 檔"""
+    record_length = 1 + sum(length for _, length in CO18H_FIELDS)
+    header_length = 32 + 32 * len(CO18H_FIELDS) + 1
+    header = struct.pack('<BBBBIHH20x', 3, 125, 1, 1, len(records), header_length, record_length)
+    for name, length in CO18H_FIELDS:
+        header += name.encode('ascii').ljust(11, b'\x00') + b'C' + b'\x00' * 4 + bytes([length]) + b'\x00' * 15
+    header += b'\r'
+    body = b''.join(
+        b' ' + b''.join(value.ljust(length) for value, (_, length) in zip(record, CO18H_FIELDS))
+        for record in records
+    )
+    path.write_bytes(header + body + b'\x1a')
+
+
+def run_loader(path: Path, patient_ids: list, **kwargs) -> dict:
+    QCoreApplication.instance() or QCoreApplication([])
+    loader = UltraBloodPressureLoader(str(path), patient_ids, **kwargs)
+    results = []
+    loader.finished.connect(results.append)
+    loader.load()
+    return results[0]
+
+
+def unsorted_tail_records() -> list:
+    """2000 筆近期血壓記錄，之後附加 5000 筆補登的舊記錄（檔尾未依日期排列）"""
+    recent = tw_date(date.today() - timedelta(days=10))
+    old = tw_date(date.today() - timedelta(days=5 * 365))
+    records = [(f"{i % 400 + 1:07d}".encode('ascii'), recent, b'080000', b'BP', b'120/80')
+               for i in range(2000)]
+    records += [(f"{i % 400 + 1:07d}".encode('ascii'), old, b'080000', b'BP', b'130/85')
+                for i in range(5000)]
+    return records
+
+
+def test_unsorted_tail_is_not_date_ordered(tmp_path):
+    path = tmp_path / 'CO18H.DBF'
+    write_co18h(path, unsorted_tail_records())
+    assert not DbfRawReader(str(path)).is_date_ordered('HDATE')
+
+
+def test_unsorted_tail_preset_range_scans_whole_file(tmp_path):
+    path = tmp_path / 'CO18H.DBF'
+    write_co18h(path, unsorted_tail_records())
+    patient_ids = [f"{i:07d}" for i in range(1, 401)]
+
+    result = run_loader(path, patient_ids, years_limit=1.0)
+
+    assert sum(1 for record in result.values() if record['systolic']) == 400
+    assert result['0000001']['value'] == '120/80'
+
+
+def test_unsorted_tail_custom_range_scans_whole_file(tmp_path):
+    path = tmp_path / 'CO18H.DBF'
+    write_co18h(path, unsorted_tail_records())
+    patient_ids = [f"{i:07d}" for i in range(1, 401)]
+
+    result = run_loader(path, patient_ids, start_date=date.today() - timedelta(days=30),
+                        end_date=date.today())
+
+    assert sum(1 for record in result.values() if record['systolic']) == 400